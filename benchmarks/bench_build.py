@@ -0,0 +1,172 @@
+"""
+Benchmark of the schedule build on synthetic schedule files.
+
+It generates schedule files with N sources over M media files, several priority layers, looped and
+cadenced sources and every interruption policy. Media durations are stubbed, nothing is probed.
+load_schedule_files, extend_schedule and save_schedule are timed separately, with their peak memory,
+as well as reading the built schedule back as the player does at startup.
+Schedule files are expanded in this process by default. With --workers, the CPU time of the worker processes
+is added to the phases, their memory is not traced.
+
+Usage: PYTHONPATH=.:src python benchmarks/bench_build.py [--files 10] [--sources 40] [--media 200]
+           [--duration 24h] [--horizon 6h] [--workers 1] [--output build.json]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import yaml
+
+from src.build import ScheduleBuilder
+from src.config import ALL_YAML_FILE, BINARY_SCHEDULE_FILE
+from src.mediacache import DurationCache
+from src.schedulebin import read_schedule_bin
+from src.scheduler import read_schedule_yaml
+from src.timeutils import to_delta
+
+LAYERS = [
+    # priority, schedule options
+    (100, {"loop": True, "clip_skip_time_after_interruption": True}),
+    (80, {"loop": True, "clip_continue_after_interruption": True}),
+    (50, {"loop": True, "clip_restart_after_interruption": True, "clip_play_duration": "2m"}),
+    (10, {"loop": True, "clip_repeat_interval": "15m", "clip_play_duration": "30s"}),
+    (0, {"clip_play_duration": "10s"}),
+]
+
+
+def stub_duration(path: str) -> timedelta:
+    """A stable fake duration between 10s and 10m"""
+    h = int(hashlib.md5(path.encode()).hexdigest()[:8], 16)
+    return timedelta(seconds=10 + h % 590)
+
+
+def generate(root: str, files: int, sources: int, media: int, duration: timedelta, start_at: datetime) -> str:
+    """Write synthetic media and schedule files into root, return the schedule glob"""
+    media_dir = os.path.join(root, "media")
+    for layer in range(len(LAYERS)):
+        os.makedirs(os.path.join(media_dir, f"layer{layer}"), exist_ok=True)
+    for i in range(media):
+        open(os.path.join(media_dir, f"layer{i % len(LAYERS)}", f"clip{i:05}.mp4"), "w").close()
+
+    schedule_dir = os.path.join(root, "scheduling")
+    os.makedirs(schedule_dir, exist_ok=True)
+    for f in range(files):
+        file_sources = []
+        for i in range(f, sources, files):
+            layer = i % len(LAYERS)
+            priority, options = LAYERS[layer]
+            s = {
+                "source": os.path.join(media_dir, f"layer{layer}", f"clip*{i % 10}.mp4"),
+                "priority": priority,
+                "start_at": int(i * 7 % 3600),
+            }
+            s.update(options)
+            if s.get("loop"):
+                s["end_at"] = int(duration.total_seconds())
+            file_sources.append(s)
+        with open(os.path.join(schedule_dir, f"schedule{f:03}.yaml"), "w") as fp:
+            yaml.safe_dump({"start_at": start_at.isoformat(sep=" "), "sources": file_sources}, fp)
+    return os.path.join(schedule_dir, "*.yaml")
+
+
+def _children_cpu() -> float:
+    """CPU time of the terminated worker processes"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def measure(name: str, report: dict, coro, memory: bool):
+    if memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    c0 = time.process_time()
+    w0 = _children_cpu()
+    await coro
+    report[name] = {"wall": time.perf_counter() - t0, "cpu": time.process_time() - c0}
+    workers_cpu = _children_cpu() - w0
+    if workers_cpu:
+        report[name]["cpu"] += workers_cpu
+        report[name]["workers_cpu"] = workers_cpu
+    if memory:
+        report[name]["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as root:
+        start_at = datetime.now().replace(microsecond=0)
+        pattern = generate(root, args.files, args.sources, args.media, to_delta(args.duration), start_at)
+
+        sb = ScheduleBuilder()
+        sb.config["scheduling"].update({"path": pattern, "outDir": os.path.join(root, "build"),
+                                        "buildWorkers": args.workers})
+        sb.durations = DurationCache(None, probe=stub_duration)
+        sb.horizon = to_delta(args.horizon, default=None)
+
+        phases = {}
+        await measure("load_schedule_files", phases, sb.load_schedule_files(), args.memory)
+        until = datetime.now() + sb.horizon if sb.horizon else None
+        await measure("extend_schedule", phases, sb.extend_schedule(until), args.memory)
+        await measure("save_schedule", phases, sb.save_schedule(), args.memory)
+        # player startup
+        out_dir = sb.config["scheduling"]["outDir"]
+        bin_path = os.path.join(out_dir, BINARY_SCHEDULE_FILE)
+        yaml_path = os.path.join(out_dir, ALL_YAML_FILE)
+        await measure("read_schedule_bin", phases, _call(read_schedule_bin, bin_path), args.memory)
+        await measure("read_schedule_yaml", phases, _call(read_schedule_yaml, yaml_path), args.memory)
+
+        return {
+            "commit": _git_commit(),
+            "params": vars(args),
+            "raw_clips": sum(len(x.clips) for x in sb.shards.values()),
+            "scheduled_clips": len(sb.schedule),
+            "phases": phases
+        }
+
+
+async def _call(fn, *args):
+    return fn(*args)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedule build benchmark on synthetic schedules")
+    parser.add_argument("--files", type=int, default=10, help="number of schedule files")
+    parser.add_argument("--sources", type=int, default=40, help="number of sources, spread over the files")
+    parser.add_argument("--media", type=int, default=200, help="number of media files")
+    parser.add_argument("--duration", default="24h", help="how long looped sources run")
+    parser.add_argument("--horizon", default=None, help="build only this horizon, e.g. 6h")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes expanding the schedule files, their memory is not traced")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="don't trace memory")
+    parser.add_argument("--output", help="write the report to this json file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(run(args))
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Replay a schedule against fake VLC servers and report the playout timing:
+per-transition latency, commands per transition, start time error and the playout metrics.
+
+Usage: PYTHONPATH=.:src python benchmarks/bench_playout.py [--schedule build/scheduled.bin]
+           [--synthetic 20] [--clip-seconds 1] [--speed 1] [--latency 0.02] [--jitter 0.01] [--preroll]
+           [--no-compensation] [--subsecond-seek] [--output playout.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+from src import metrics
+from src.fakevlc import FakeVLC
+from src.schedulebin import read_schedule_bin
+from src.scheduler import VideoScheduler, read_schedule_yaml
+from src.scheduler_types import ScheduleClip
+
+
+def percentiles(values: [float]) -> {str: float}:
+    values = sorted(values)
+    if not values:
+        return {}
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q))]
+    return {"count": len(values), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": values[-1]}
+
+
+def synthetic_schedule(n: int, clip_seconds: float) -> [ScheduleClip]:
+    clips = []
+    start_at = datetime.now()
+    duration = timedelta(seconds=clip_seconds)
+    for i in range(n):
+        clips.append(ScheduleClip(path=f"/media/clip{i % 5}.mp4", start_at=start_at, end_at=start_at + duration,
+                                  duration=duration * 10, play_duration=duration,
+                                  cursor_start_at=duration * (i % 3), cursor_end_at=duration * (i % 3 + 1)))
+        start_at += duration
+    return clips
+
+
+def rebase(clips: [ScheduleClip], start_at: datetime, speed: float) -> [ScheduleClip]:
+    """Move the schedule to start at start_at, speed > 1 compresses time"""
+    origin = clips[0].start_at
+    for c in clips:
+        c.start_at = start_at + (c.start_at - origin) / speed
+        c.end_at = start_at + (c.end_at - origin) / speed
+    return clips
+
+
+class ReplayScheduler(VideoScheduler):
+    def __init__(self, clips: [ScheduleClip], out_dir: str):
+        super().__init__()
+        self.replay_clips = clips
+        # don't mix the playlist ids of the fake servers with the real ones
+        self.config["scheduling"]["outDir"] = out_dir
+
+    async def load_schedule(self):
+        self.update_schedule(await self._sync_playlists(self.replay_clips))
+
+
+async def run(args):
+    if args.schedule:
+        read = read_schedule_bin if args.schedule.endswith(".bin") else read_schedule_yaml
+        clips = read(args.schedule)[:args.limit]
+    else:
+        clips = synthetic_schedule(args.synthetic, args.clip_seconds)
+    clips = rebase(clips, datetime.now() + timedelta(seconds=1), args.speed)
+
+    servers = [await FakeVLC("127.0.0.1", args.port + i, args.latency, args.jitter, args.preroll).start()
+               for i in range(2 if args.preroll else 1)]
+
+    metrics.REGISTRY.reset()
+    monitor = asyncio.create_task(metrics.monitor_event_loop(0.1))
+    with tempfile.TemporaryDirectory() as out_dir:
+        vs = ReplayScheduler(clips, out_dir)
+        vs.config["vlc"].update({"start": False, "host": "127.0.0.1", "port": args.port, "interface": "http",
+                                 "preroll": args.preroll, "subsecond_seek": args.subsecond_seek})
+        vs.latency_compensation = not args.no_compensation
+        vs.preroll_time = timedelta(seconds=args.preroll_time) if args.preroll else None
+        try:
+            await vs.start_scheduling()
+        finally:
+            monitor.cancel()
+            for server in servers:
+                await server.stop()
+
+    return {
+        "clips": len(clips),
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "preroll": args.preroll,
+        "latency_compensation": not args.no_compensation,
+        "subsecond_seek": args.subsecond_seek,
+        "transition_seconds": percentiles([x[1] for x in vs.transitions]),
+        "commands_per_transition": percentiles([x[0] for x in vs.transitions]),
+        "start_error_seconds": percentiles(list(vs.start_errors)),
+        "abs_start_error_seconds": percentiles([abs(x) for x in vs.start_errors]),
+        "requests": sum(x.requests for x in servers),
+        "metrics": metrics.REGISTRY.snapshot()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Playout timing benchmark against fake VLC servers")
+    parser.add_argument("--schedule", help="a built schedule (bin or yaml), default is a synthetic schedule")
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first clips of the schedule")
+    parser.add_argument("--synthetic", type=int, default=20, help="number of synthetic clips")
+    parser.add_argument("--clip-seconds", type=float, default=1.0, help="synthetic clip duration")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression of the schedule")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.02, help="fake VLC response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="fake VLC random extra latency in seconds")
+    parser.add_argument("--preroll", action="store_true", help="use two players and preroll clips")
+    parser.add_argument("--preroll-time", type=float, default=0.5)
+    parser.add_argument("--no-compensation", action="store_true", help="start clips at their time, not earlier")
+    parser.add_argument("--subsecond-seek", action="store_true", help="seek to the millisecond")
+    parser.add_argument("--output", help="write the report to this json file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark of the sweep-line conflict resolver on synthetic multi-priority schedules.
+
+Usage: PYTHONPATH=. python benchmarks/bench_timeline.py [sizes...]
+"""
+import heapq
+import sys
+import time
+from datetime import datetime, timedelta
+
+from src.scheduler_types import ScheduleClip, ScheduleSource
+from src.timeline import resolve_timeline
+
+START_AT = datetime(2030, 1, 1)
+
+LAYERS = [
+    # priority, clip length, interval between starts, policy
+    (100, 30, 30, "clip_skip_time_after_interruption"),
+    (50, 20, 45, "clip_continue_after_interruption"),
+    (10, 15, 70, "clip_restart_after_interruption"),
+    (0, 5, 110, None),
+]
+
+
+def synthetic_sources() -> [(ScheduleSource, int, int)]:
+    sources = []
+    for priority, length, interval, policy in LAYERS:
+        s = ScheduleSource(priority=priority, source=f"layer{priority}")
+        if policy:
+            setattr(s, policy, True)
+        s.clip_stop_if_interrupted = policy is None
+        sources.append((s, length, interval))
+    return sources
+
+
+def synthetic_clips(n: int, sources: [(ScheduleSource, int, int)]):
+    """Yield n clips spread over the layers, ordered by start time and priority"""
+
+    # clips per second of timeline, used to spread n clips over the layers
+    rate = sum(1 / interval for _, _, interval in sources)
+    horizon = n / rate
+    streams = []
+    for s, length, interval in sources:
+        streams.append(((START_AT + timedelta(seconds=t), s, length) for t in range(0, int(horizon), interval)))
+
+    for start_at, s, length in heapq.merge(*streams, key=lambda x: (x[0], x[1].priority)):
+        duration = timedelta(seconds=length)
+        yield ScheduleClip(source_id=s.id, priority=s.priority, path=s.source,
+                           start_at=start_at, end_at=start_at + duration,
+                           duration=duration, play_duration=duration,
+                           cursor_end_at=duration)
+
+
+def bench(n: int):
+    sources = synthetic_sources()
+    clips = list(synthetic_clips(n, sources))
+    t0 = time.perf_counter()
+    count = 0
+    for _ in resolve_timeline(clips, sources={s.id: s for s, _, _ in sources}):
+        count += 1
+    elapsed = time.perf_counter() - t0
+    return len(clips), count, elapsed
+
+
+def main(sizes):
+    print(f"{'clips':>10} {'output':>10} {'seconds':>10} {'us/clip':>10}")
+    for n in sizes:
+        clips, count, elapsed = bench(n)
+        print(f"{clips:>10} {count:>10} {elapsed:>10.3f} {elapsed / clips * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -1,23 +1,33 @@
 import asyncio
-import csv
+import heapq
 import math
 import sys
+import time
 import typing
 from datetime import datetime, timedelta
 import glob
 import os
 from asyncio import PriorityQueue, QueueEmpty
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from dataclasses import dataclass, Field, field, asdict, replace
 
 import yaml
 import logging
 
-from src.config import ALL_YAML_FILE, FILTERED_YAML_FILE, FILTERED_CSV_FILE, ALL_CSV_FILE
-from src.timeutils import to_delta, to_date, video_duration, fmod_delta
-from src.scheduler_types import ScheduleFile, ScheduleSource, ScheduleClip
-from vlc import VLCLauncher, VLCHTTPClient
+from src.buildcache import BuildCache, schedule_fingerprint
+from src.catalog import MediaCatalog
+from src.config import DURATION_CACHE_FILE
+from src.export import export_schedule
+from src.mediacache import DurationCache
+from src.mediaprobe import is_image
+from src.profiling import Profiler, profile_options
+from src.timeutils import to_delta, to_date, video_duration, fmod_delta, to_us, IMAGE_DURATION
+from src.scheduler_types import ScheduleFile, ScheduleSource, ScheduleClip, ScheduleClipArray
+from src.timeline import resolve_timeline
 
 CONFIGFILE = os.getenv('CONFIG') or "config.yaml"
+# errors of an invalid schedule file, a reload keeps its previous schedule
+RELOAD_ERRORS = (TypeError, ValueError, NotImplementedError, OSError, yaml.YAMLError)
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)-8s %(message)s')
 logger = logging.getLogger(__name__)
@@ -25,299 +35,515 @@ logger = logging.getLogger(__name__)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 
+class SourceClipGenerator:
+    """
+    Lazily expand a source into its clips, ordered by start time.
+    It only holds the expansion cursor, thus it can be pickled and resumed in another process.
+    """
+
+    def __init__(self, s: ScheduleSource, clip_durations: {str: timedelta}):
+        assert (s)
+        if s.loop and not s.end_at:
+            raise ValueError(f"Loop source must specify an end_at time")
+
+        self.source = s
+        self.clip_durations = clip_durations
+        self.clip_index = 0
+        self.clip_start_at: datetime = s.start_at
+        self.clip_end_at: datetime | None = None
+        self.clip_states: {str: (datetime, timedelta)} = {}  # last end_at and cursor_end_at of each path
+        self.pending: ScheduleClip | None = None
+        self.done = bool(s.clips) or not s.clip_paths
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> ScheduleClip:
+        if self.pending:
+            clip, self.pending = self.pending, None
+            return clip
+        if self.done:
+            raise StopIteration
+
+        s = self.source
+        if self.clip_index >= len(s.clip_paths):
+            # a full pass over the paths is done
+            if not s.loop or (self.clip_end_at and self.clip_end_at >= s.end_at):
+                self.done = True
+                raise StopIteration
+            self.clip_index = 0
+
+        if s.end_at and self.clip_start_at >= s.end_at:
+            self.done = True
+            raise StopIteration
+
+        i = self.clip_index
+        p = s.clip_paths[i]
+        clip_start_at = self.clip_start_at
+        clip_cursor_start_at = timedelta(0)
+
+        if p in self.clip_states:
+            prev_end_at, prev_cursor_end_at = self.clip_states[p]
+            if s.clip_continue_after_interruption:
+                clip_cursor_start_at = prev_cursor_end_at
+            if s.clip_skip_time_after_interruption:
+                clip_cursor_start_at = prev_cursor_end_at + (clip_start_at - prev_end_at)
+                assert clip_cursor_start_at >= timedelta(0)
+
+        clip = make_schedule_clip(
+            p, clip_index=i, parent=s,
+            clip_duration=self.clip_durations[p],
+            clip_start_at=clip_start_at,
+            clip_max_end_at=s.end_at,
+            clip_play_duration=s.clip_play_duration,
+            clip_loop=s.clip_loop,
+            clip_cursor_start_at=clip_cursor_start_at
+        )
+
+        self.clip_states[p] = (clip.end_at, clip.cursor_end_at)
+        self.clip_end_at = clip.end_at
+        self.clip_index += 1
+
+        if s.clips_are_sequential:
+            self.clip_start_at += clip.play_duration
+        elif s.clips_are_cadenced:
+            self.clip_start_at += s.clip_repeat_interval
+            if s.clip_repeat_interval < clip.play_duration:
+                logger.warning(
+                    f"Clip repeat interval {s.clip_repeat_interval} < clip duration {clip.play_duration}")
+        else:
+            raise NotImplemented()
+        return clip
+
+    def take_until(self, until: datetime | None) -> [ScheduleClip]:
+        """Return the next clips starting before until, all remaining clips if until is None"""
+        clips = []
+        for c in self:
+            if until and c.start_at >= until:
+                self.pending = c
+                break
+            clips.append(c)
+        return clips
+
+
+def make_schedule_clip(clip_path: str,
+                       clip_index: int,
+                       parent: ScheduleSource,
+                       clip_duration: timedelta,
+                       clip_start_at: datetime,
+                       clip_play_duration: timedelta,
+                       clip_loop: bool,
+                       clip_cursor_start_at: timedelta,
+                       clip_max_end_at: datetime):
+    assert clip_path
+    assert parent
+    assert clip_start_at
+    assert not clip_cursor_start_at or clip_cursor_start_at >= timedelta(0)
+
+    clip_play_duration = clip_play_duration or clip_duration
+    clip_cursor_start_at = fmod_delta(clip_cursor_start_at, clip_duration)
+    clip_cursor_end_at = fmod_delta(clip_cursor_start_at + clip_play_duration, clip_duration)
+    if clip_cursor_start_at.total_seconds() > clip_duration.total_seconds():
+        logger.warning(f"Cursor start > clip duration")
+    if clip_cursor_end_at.total_seconds() > clip_duration.total_seconds():
+        logger.warning(f"Cursor end > clip duration")
+    clip_end_at = to_date(clip_play_duration, clip_start_at, default=None)
+    if clip_max_end_at:
+        clip_end_at = min(clip_end_at, clip_max_end_at)
+
+    c = ScheduleClip(
+        priority=parent.priority,
+        source_id=parent.id,
+        path=clip_path,
+        start_at=clip_start_at,
+        end_at=clip_end_at,
+        duration=clip_duration,
+        play_duration=clip_play_duration,
+        loop=clip_loop,  # end_at can be after actual video end, thus loop it
+        cursor_start_at=clip_cursor_start_at,
+        cursor_end_at=clip_cursor_end_at
+    )
+
+    logger.debug(
+        f"Add clip {clip_path} start {c.start_at} end {c.end_at}, cursor start {c.cursor_start_at} end {c.cursor_end_at}")
+
+    return c
+
+
+
+def expand_schedule_shard(generators: [SourceClipGenerator], until: datetime | None, timed: bool = False) \
+        -> ([SourceClipGenerator], ScheduleClipArray, list[tuple[float, float]] | None):
+    """
+    Expand all sources of a schedule file up to until into a single clip stream, ordered by start time and priority.
+    It runs in a worker process, thus it must only depend on its (picklable) arguments,
+    the advanced generators are returned to be resumed at the next call.
+    When timed, the wall and CPU time of each source (then of the merge) are returned too.
+    """
+    if not timed:
+        return generators, ScheduleClipArray(heapq.merge(*[g.take_until(until) for g in generators])), None
+    timings = []
+    source_clips = []
+    for g in generators:
+        t0, c0 = time.perf_counter(), time.thread_time()
+        source_clips.append(g.take_until(until))
+        timings.append((time.perf_counter() - t0, time.thread_time() - c0))
+    t0, c0 = time.perf_counter(), time.thread_time()
+    clips = ScheduleClipArray(heapq.merge(*source_clips))
+    timings.append((time.perf_counter() - t0, time.thread_time() - c0))
+    return generators, clips, timings
+
+
+def expand_schedule_shards(shards: ["ScheduleShard"], until: datetime | None, timed: bool, keep_going: bool) -> list:
+    """expand_schedule_shard of each shard in turn, with keep_going the error of a failing shard is its result"""
+    results = []
+    for x in shards:
+        try:
+            results.append(expand_schedule_shard(x.generators, until, timed))
+        except Exception as e:
+            if not keep_going:
+                raise
+            results.append(e)
+    return results
+
+
+def resolve_schedule_shards(shards: ["ScheduleShard"], until: datetime | None,
+                            prune_before: datetime | None = None) -> [ScheduleClip]:
+    """Forget the clips of the shards ended before prune_before, and resolve the timeline of the rest"""
+    if prune_before:
+        for shard in shards:
+            shard.prune(prune_before)
+    clips = heapq.merge(*[x.clips for x in shards])
+    sources = {k: v for x in shards for k, v in x.sources.items()}
+    return list(resolve_timeline(clips, until=until, sources=sources))
+
+
+class ScheduleShard:
+    """A schedule file, expanded lazily into a clip stream ordered by start time and priority"""
+
+    def __init__(self, path: str, sources: [ScheduleSource], clip_durations: {str: timedelta}):
+        self.path = path
+        self.sources: {int: ScheduleSource} = {s.id: s for s in sources}
+        self.generators = [SourceClipGenerator(s, clip_durations) for s in sources]
+        self.clips = ScheduleClipArray()
+
+    @property
+    def exhausted(self):
+        return all(g.done and not g.pending for g in self.generators)
+
+    def prune(self, before: datetime):
+        """Forget clips ended before the given time"""
+        before = to_us(before)
+        i = 0
+        while i < len(self.clips) and self.clips.end_at_us(i) <= before:
+            i += 1
+        if i:
+            del self.clips[:i]
+
+
+def duration_cache_path(config: dict) -> str:
+    cache_dir = config["scheduling"].get("cacheDir") or config["scheduling"]["outDir"]
+    return os.path.join(cache_dir, DURATION_CACHE_FILE)
+
+
+def source_key(path: str, index: int, s: ScheduleSource) -> str:
+    """Name of a source in the profile report"""
+    return f"{path}[{index}] {s.source}"
+
+
 class ScheduleBuilder:
-    def __init__(self):
-        self.config = yaml.safe_load(open(CONFIGFILE))
-        self._all_prioritized_clips = PriorityQueue()
+    def __init__(self, config: dict | None = None, catalog: MediaCatalog | None = None,
+                 durations: DurationCache | None = None, profiler: Profiler | None = None,
+                 anchor: datetime | None = None):
+        """
+        The catalog and the duration cache can be shared by several builders, e.g. of channels.
+        Relative start times of schedule files count from anchor, default is the time the files are loaded.
+        """
+        self.config = config or yaml.safe_load(open(CONFIGFILE))
+        self.anchor = anchor
+        self.profiler = profiler or Profiler.from_env()
+        self._probe_times: {str: (float, float)} = {}  # wall and CPU time of the last probes, when profiling
+        self.shards: {str: ScheduleShard} = {}
         self.schedule = []
+        self.horizon: timedelta | None = to_delta(self.config["scheduling"].get("horizon"), default=None)
+        self.built_until: datetime | None = None
+        self.lock = asyncio.Lock()  # extensions and reloads of the running schedule don't interleave
+        self._clip_durations: {str: timedelta} = {}
+        self.catalog = catalog or MediaCatalog()
+        self.durations = durations or DurationCache(duration_cache_path(self.config))
+        self.image_duration = to_delta(self.config["scheduling"].get("imageDuration"), default=IMAGE_DURATION)
 
     async def load_schedule_files(self):
-        path = self.config["scheduling"]["path"]
-        logger.info(f"Load schedules from {path}")
+        with self.profiler.phase("load_schedule_files"):
+            path = self.config["scheduling"]["path"]
+            logger.info(f"Load schedules from {path}")
+            self.anchor = self.anchor or datetime.now()
+            # in a thread, the player may already be playing
+            file_sources = await asyncio.get_running_loop().run_in_executor(None, self._read_all_files, path)
+
+            await self._probe_clip_durations({p for sources in file_sources.values()
+                                              for s in sources for p in s.clip_paths})
+            self._profile_source_probes(file_sources)
+
+            self.shards = {
+                k: ScheduleShard(k, sources, {p: self._clip_durations[p] for s in sources for p in s.clip_paths})
+                for k, sources in file_sources.items()
+            }
+
+    def _read_all_files(self, path: str) -> {str: [ScheduleSource]}:
+        self.catalog.refresh()
         schedule_files = [x for x in glob.glob(path) if os.path.isfile(x)]
-
-        for schedule_path in schedule_files:
-            await self._load_schedule_file(schedule_path)
-
-    async def _load_schedule_file(self, schedule_path):
+        file_sources = self._read_schedule_files(schedule_files, self.anchor)
+        return {k: v for k, v in file_sources.items() if v}
+
+    async def _expand_schedule_shards(self, shards: [ScheduleShard], until: datetime | None,
+                                      keep_going: bool = False) -> {str: Exception}:
+        """
+        Expand each schedule file on its own up to until, in a process pool.
+        With keep_going, the files failing to expand are left as they were and returned with their error,
+        otherwise the first error is raised.
+        """
+        workers = min(self.config["scheduling"].get("buildWorkers") or os.cpu_count() or 1, len(shards))
+        timed = self.profiler.enabled
+        with self.profiler.phase("expand_schedule_files"):
+            loop = asyncio.get_running_loop()
+            if workers <= 1:
+                # in a thread, the player shares the event loop
+                results = await loop.run_in_executor(None, expand_schedule_shards, shards, until, timed, keep_going)
+            else:
+                logger.info(f"Expand {len(shards)} schedule files with {workers} workers")
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    results = await asyncio.gather(*[loop.run_in_executor(executor, expand_schedule_shard,
+                                                                          x.generators, until, timed)
+                                                     for x in shards], return_exceptions=keep_going)
+        failed = {}
+        for shard, result in zip(shards, results):
+            if isinstance(result, BaseException):
+                failed[shard.path] = result
+                continue
+            generators, clips, timings = result
+            shard.generators = generators
+            # copying large expansions takes a while too
+            await asyncio.get_running_loop().run_in_executor(None, shard.clips.extend, clips)
+            if timings:
+                for i, (g, (wall, cpu)) in enumerate(zip(generators, timings)):
+                    self.profiler.add("sources", source_key(shard.path, i, g.source), wall, cpu, "expand")
+                self.profiler.add("files", shard.path, sum(x[0] for x in timings), sum(x[1] for x in timings),
+                                  "expand")
+        return failed
+
+    @property
+    def exhausted(self):
+        return all(x.exhausted for x in self.shards.values())
+
+    @property
+    def schedule_end(self) -> datetime | None:
+        """End of the window the schedule is built for, None when it is complete"""
+        return None if self.exhausted else self.built_until
+
+    async def extend_schedule(self, until: datetime | None):
+        """Expand all schedule files up to until, and resolve the resulting timeline"""
+        logger.info(f"Extend schedule until {until or 'end'}")
+        with self.profiler.phase("extend_schedule"):
+            async with self.lock:
+                shards = list(self.shards.values())
+                await self._expand_schedule_shards(shards, until)
+                self.built_until = until
+                # keep some past clips, interrupted ones may still be resumed
+                await self._resolve_schedule(datetime.now() - self.horizon if until and self.horizon else None)
+
+    async def reload_schedule_files(self, changed: {str}, removed: {str}):
+        """Rebuild only the given schedule files and resolve the timeline again"""
+        with self.profiler.phase("reload_schedule_files"):
+            async with self.lock:
+                await self._reload_schedule_files(changed, removed)
+
+    def _read_changed_files(self, changed: {str}, anchor: datetime) -> {str: [ScheduleSource]}:
+        # media may have changed too, durations of unchanged files are kept in the catalog
+        self.catalog.refresh()
+        file_sources = {}
+        for path in sorted(x for x in changed if os.path.isfile(x)):
+            try:
+                file_sources.update(self._read_schedule_files([path], anchor))
+            except RELOAD_ERRORS as e:
+                logger.warning(f"Reload of {path} failed, keep its previous schedule: {e}")
+        return file_sources
+
+    async def _reload_schedule_files(self, changed: {str}, removed: {str}):
+        # relative times count from the anchor the schedule was built with, an unchanged source keeps its clips
+        anchor = self.anchor or datetime.now()
+        # scanning media and parsing files in a thread, the player shares the event loop
+        file_sources = await asyncio.get_running_loop().run_in_executor(None, self._read_changed_files, changed, anchor)
+        await self._probe_clip_durations({p for sources in file_sources.values()
+                                          for s in sources for p in s.clip_paths})
+        self._profile_source_probes(file_sources)
+
+        # new shards are built aside, the running ones are swapped in one step once they are all expanded
+        shards: {str: ScheduleShard | None} = {}
+        for path, sources in file_sources.items():
+            try:
+                shards[path] = ScheduleShard(
+                    path, sources, {p: self._clip_durations[p] for s in sources for p in s.clip_paths}
+                ) if sources else None
+            except RELOAD_ERRORS as e:
+                logger.warning(f"Reload of {path} failed, keep its previous schedule: {e}")
+        expanded = [x for x in shards.values() if x]
+        if expanded:
+            failed = await self._expand_schedule_shards(expanded, self.built_until, keep_going=True)
+            for path, e in failed.items():
+                logger.warning(f"Reload of {path} failed, keep its previous schedule: {e}")
+                del shards[path]
+
+        for path in removed:
+            logger.info(f"Unload schedule {path}")
+            self.shards.pop(path, None)
+        for path, shard in shards.items():
+            if shard:
+                self.shards[path] = shard
+            else:
+                self.shards.pop(path, None)
+        await self._resolve_schedule(datetime.now() - self.horizon if self.built_until and self.horizon else None)
+
+    async def _resolve_schedule(self, prune_before: datetime | None = None):
+        """Resolve the timeline in a thread, the schedule is swapped once it is done"""
+        with self.profiler.phase("resolve_timeline"):
+            self.schedule = await asyncio.get_running_loop().run_in_executor(
+                None, resolve_schedule_shards, list(self.shards.values()), self.built_until, prune_before)
+
+    def _read_schedule_files(self, paths: [str], anchor: datetime) -> {str: [ScheduleSource]}:
+        file_sources = {}
+        with self.profiler.phase("read_schedule_files"):
+            for path in paths:
+                with self.profiler.timed("files", path, "read"):
+                    file_sources[path] = self._read_schedule_file(path, anchor)
+        return file_sources
+
+    def _read_schedule_file(self, schedule_path, anchor: datetime) -> [ScheduleSource]:
         assert schedule_path
         try:
             schedule_data = yaml.safe_load(open(schedule_path))
             if not schedule_data:
                 # logger.debug(f"Schedule {schedule_path} is empty")
-                return
+                return []
             logger.info(f"Load schedule {schedule_path}")
             schedule_file = ScheduleFile(**schedule_data)
         except TypeError as e:
             logger.warning(f"Load failed: {e}")
-            return
+            return []
 
-        file_start_at = schedule_file.start_at = to_date(schedule_file.start_at, start_date=datetime.now(),
-                                                         default=datetime.now())
+        file_start_at = schedule_file.start_at = to_date(schedule_file.start_at, start_date=anchor, default=anchor)
         file_end_at = schedule_file.end_at = to_date(schedule_file.end_at, start_date=file_start_at, default=None)
 
         if not schedule_file.sources:
-            return
+            return []
 
         sources = [ScheduleSource(parent=schedule_file, **x) for x in schedule_file.sources]
 
-        for s in sources:
-            await self._load_schedule_source(s, file_start_at=file_start_at, file_end_at=file_end_at)
+        for i, s in enumerate(sources):
+            with self.profiler.timed("sources", source_key(schedule_path, i, s), "read"):
+                self._read_schedule_source(s, file_start_at=file_start_at, file_end_at=file_end_at)
+        return sources
 
-    async def _load_schedule_source(self, s, file_start_at: datetime, file_end_at: datetime):
+    def _read_schedule_source(self, s, file_start_at: datetime, file_end_at: datetime):
         assert (s)
         logger.debug(f"Add source {s.source}")
 
-        source_clip_paths = s.clip_paths = sorted(glob.glob(s.source))
+        s.clip_paths = self.catalog.glob(s.source)
         source_start_at = s.start_at = to_date(s.start_at, start_date=file_start_at, default=file_start_at)
-        source_end_at = s.end_at = to_date(s.end_at, start_date=source_start_at, default=file_end_at)
-        clip_repeat_interval = s.clip_repeat_interval = to_delta(s.clip_repeat_interval, start_date=source_start_at,
-                                                                 default=None)
-        clip_play_duration = s.clip_play_duration = to_delta(s.clip_play_duration, start_date=source_start_at,
-                                                             default=None)
+        s.end_at = to_date(s.end_at, start_date=source_start_at, default=file_end_at)
+        s.clip_repeat_interval = to_delta(s.clip_repeat_interval, start_date=source_start_at, default=None)
+        s.clip_play_duration = to_delta(s.clip_play_duration, start_date=source_start_at, default=None)
 
-        are_sequential = s.clips_are_sequential = s.clip_repeat_interval is None
-        are_cadenced = s.clips_are_cadenced = not s.clips_are_sequential
+        s.clips_are_sequential = s.clip_repeat_interval is None
+        s.clips_are_cadenced = not s.clips_are_sequential
 
         s.clip_stop_if_interrupted = (not s.clip_continue_after_interruption and
                                       not s.clip_restart_after_interruption and
                                       not s.clip_skip_time_after_interruption)
 
         s.clip_loop = s.clip_loop or s.clip_continue_after_interruption or s.clip_skip_time_after_interruption
-        s.clip_loop = s.clip_loop or s.clip_continue_after_interruption or s.clip_skip_time_after_interruption
-
-        if s.clips or not s.clip_paths:
-            return s
-
-        s.clips = []
-
-        clip_start_at = source_start_at
-        clip_end_at = None
-
-        if s.loop and not s.end_at:
-            raise ValueError(f"Loop source must specify an end_at time")
-
-        clip_states = {}
-
-        loop = s.loop
-        while not loop or (loop and s.end_at and (not clip_end_at or clip_end_at < s.end_at)):
-            for i, p in enumerate(s.clip_paths):
-                prev_state: ScheduleClip = clip_states[p] if p in clip_states else None
-
-                clip_cursor_start_at = timedelta(0)
-
-                if prev_state:
-                    if s.clip_continue_after_interruption:
-                        clip_cursor_start_at = prev_state.cursor_end_at
-                    if s.clip_skip_time_after_interruption:
-                        clip_cursor_start_at = prev_state.cursor_end_at + (clip_start_at - prev_state.end_at)
-                        assert clip_cursor_start_at >= timedelta(0)
-
-                if s.end_at and clip_start_at >= s.end_at:
-                    loop = False
-                    break
-
-                clip = await self._load_schedule_clip(
-                    p, clip_index=i, parent=s,
-                    clip_start_at=clip_start_at,
-                    clip_max_end_at=s.end_at,
-                    clip_play_duration=clip_play_duration,
-                    clip_loop=s.clip_loop,
-                    clip_cursor_start_at=clip_cursor_start_at
-                )
-
-                clip_states[p] = clip
-                clip_end_at = clip.end_at
-
-                if are_sequential:
-                    clip_start_at += clip.play_duration
-                elif are_cadenced:
-                    clip_start_at += clip_repeat_interval
-                    if clip_repeat_interval < clip.play_duration:
-                        logger.warning(
-                            f"Clip repeat interval {clip_repeat_interval} < clip duration {clip.play_duration}")
-                else:
-                    raise NotImplemented()
-            if not loop:
-                break
-
-    async def _load_schedule_clip(self,
-                                  clip_path: str,
-                                  clip_index: int,
-                                  parent: ScheduleSource,
-                                  clip_start_at: datetime,
-                                  clip_play_duration: timedelta,
-                                  clip_loop: bool,
-                                  clip_cursor_start_at: timedelta,
-                                  clip_max_end_at: datetime):
-        assert clip_path
-        assert parent
-        assert clip_start_at
-        assert not clip_cursor_start_at or clip_cursor_start_at >= timedelta(0)
-
-        clip_duration = video_duration(clip_path)
-        clip_play_duration = clip_play_duration or clip_duration
-        clip_cursor_start_at = fmod_delta(clip_cursor_start_at, clip_duration)
-        clip_cursor_end_at = fmod_delta(clip_cursor_start_at + clip_play_duration, clip_duration)
-        if clip_cursor_start_at.total_seconds() > clip_duration.total_seconds():
-            logger.warning(f"Cursor start > clip duration")
-        if clip_cursor_end_at.total_seconds() > clip_duration.total_seconds():
-            logger.warning(f"Cursor end > clip duration")
-        clip_end_at = to_date(clip_play_duration, clip_start_at, default=None)
-        if clip_max_end_at:
-            clip_end_at = min(clip_end_at, clip_max_end_at)
-
-        c = ScheduleClip(
-            priority=parent.priority,
-            parent=parent,
-            path=clip_path,
-            start_at=clip_start_at,
-            end_at=clip_end_at,
-            duration=clip_duration,
-            play_duration=clip_play_duration,
-            loop=clip_loop,  # end_at can be after actual video end, thus loop it
-            cursor_start_at=clip_cursor_start_at,
-            cursor_end_at=clip_cursor_end_at
-        )
-
-        logger.debug(
-            f"Add clip {clip_path} start {c.start_at} end {c.end_at}, cursor start {c.cursor_start_at} end {c.cursor_end_at}")
-
-        await self._all_prioritized_clips.put(c)
-        return c
+        return s
+
+    async def _probe_clip_durations(self, clip_paths: {str}):
+        """Resolve all clip durations concurrently, before any scheduling arithmetic"""
+        workers = self.config["scheduling"].get("probeWorkers") or os.cpu_count() or 1
+        logger.info(f"Probe {len(clip_paths)} clips with {workers} workers")
+        loop = asyncio.get_running_loop()
+        clip_duration = self._timed_clip_duration if self.profiler.enabled else self._clip_duration
+        self._probe_times = {}
+        with self.profiler.phase("probe_clip_durations"), ThreadPoolExecutor(max_workers=workers) as executor:
+            paths = sorted(clip_paths)
+            durations = await asyncio.gather(*[loop.run_in_executor(executor, clip_duration, p) for p in paths])
+        self._clip_durations.update(zip(paths, durations))
+
+    def _timed_clip_duration(self, clip_path: str) -> timedelta:
+        t0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            return self._clip_duration(clip_path)
+        finally:
+            wall, cpu = time.perf_counter() - t0, time.thread_time() - c0
+            self._probe_times[clip_path] = (wall, cpu)
+            self.profiler.add("probes", clip_path, wall, cpu)
+
+    def _profile_source_probes(self, file_sources: {str: [ScheduleSource]}):
+        """Charge each source and file with the probe time of its media, media shared by sources are charged to all"""
+        if not self.profiler.enabled:
+            return
+        for path, sources in file_sources.items():
+            for i, s in enumerate(sources):
+                probed = [self._probe_times[p] for p in s.clip_paths if p in self._probe_times]
+                wall, cpu = sum(x[0] for x in probed), sum(x[1] for x in probed)
+                self.profiler.add("sources", source_key(path, i, s), wall, cpu, "probe")
+                self.profiler.add("files", path, wall, cpu, "probe")
+
+    def _clip_duration(self, clip_path: str) -> timedelta:
+        # still images have no intrinsic duration, don't decode them
+        if is_image(clip_path):
+            return self.image_duration
+        entry = self.catalog.entry(clip_path)
+        if not entry:
+            return self.durations.get(clip_path)
+        if entry.duration is None:
+            entry.duration = self.durations.get(clip_path, entry)
+        return entry.duration
 
     async def process_schedule(self):
         await self.load_schedule_files()
-
-        prioritized = self._all_prioritized_clips
-        schedule = self.schedule
-
-        _prev: ScheduleClip | None = None
-        while not prioritized.empty():
-            _next: ScheduleClip = await prioritized.get()
-            logger.debug(f"Reorder clip {_next.path}")
-
-            if not _prev:
-                schedule.append(_next)
-                _prev = schedule[-1]
-                continue
-
-            if _next.start_at < _prev.start_at:
-                logger.debug(f"Clips are not ordered by increasing time: {_next.start_at} < {_prev.start_at}")
-                schedule.pop()
-                _prev = schedule[-1]
-                continue
-
-            if _next.start_at == _prev.start_at:
-                if _next.priority < _prev.priority:
-                    raise ValueError(f"Clips are not ordered by increasing priority")
-                # ignore same priority and same time
-                logger.debug(f"Skip {_next.path}, same priority and time of _prev")
-                continue
-            if _next.start_at < _prev.end_at:
-                if _next.priority >= _prev.priority:
-                    if _next.end_at <= _prev.end_at:
-                        # new clip is shorter and with lower priority, just skip
-                        logger.debug(f"Skip {_next.path}, an higher priority clip start and ends before and after the clip")
-                        continue
-                    logger.debug(f"Crop low priority clip: {_next.path}")
-                    _next_source: ScheduleSource = _next.parent
-                    _next_old_start_at = _next_source.start_at
-                    _next_source.start_at = _prev.start_at
-                    _next.play_duration = min(_next.play_duration, _next.end_at - _next.start_at)
-                    if _next_source.clip_restart_after_interruption:
-                        pass
-                    elif (_next_source.clip_continue_after_interruption or
-                          _next_source.clip_skip_time_after_interruption):
-                        _next.cursor_start_at = fmod_delta(
-                            _next.cursor_start_at + _next.start_at - _next_old_start_at,
-                            _next.play_duration
-                        )
-                    _next.cursor_end_at = _next.cursor_start_at + _next.play_duration
-                    schedule.append(_next)
-                else:
-                    logger.debug(f"Insert high priority clip: {_prev.path}")
-                    schedule.append(_next)
-
-                    # crop previous clip, eventually split it in two
-                    _prev_source: ScheduleSource = _prev.parent
-
-                    if isinstance(_prev_source, dict):
-                        _prev_source = ScheduleSource(**_prev_source)
-
-                    _clone = _prev.clone()
-
-                    crop_delta = _prev.end_at - _next.start_at
-                    logger.debug(f"Crop clip {_prev.path} end by {crop_delta}")
-                    _prev.crop_end_time(crop_delta)
-
-                    if not _prev_source.clip_stop_if_interrupted:
-                        # _clone.crop_start_time(_prev.play_duration)
-                        # _clone.change_start_time(_next.end_at)
-
-                        if _prev_source.clip_restart_after_interruption:
-                            _clone.change_cursor_start_at(timedelta(0))
-                            _clone.change_start_time(_next.end_at)
-
-                        elif _prev_source.clip_continue_after_interruption:
-                            _clone.crop_start_time(_prev.play_duration)
-                            _clone.change_start_time(_next.end_at)
-
-                        elif _prev_source.clip_skip_time_after_interruption:
-                            _clone.crop_start_time(_prev.play_duration + _next.play_duration)
-
-                        schedule.append(_clone)
-            elif _next:
-                schedule.append(_next)
-
-            _prev = schedule[-1]
+        await self.extend_schedule(self.anchor + self.horizon if self.horizon else None)
 
     async def save_schedule(self):
         prio_level = self.config["scheduling"]["outPriorityLevel"]
         outPath = self.config["scheduling"]["outDir"]
-        os.makedirs(outPath, exist_ok=True)
-
-        yaml.add_representer(timedelta, lambda dumper, data: dumper.represent_str(str(data)))
-        yaml.add_representer(datetime, lambda dumper, data: dumper.represent_str(data.isoformat()))
-
-        path = os.path.join(outPath, ALL_YAML_FILE)
-        yaml.Dumper.ignore_aliases = lambda *args: True
-        yaml.dump({"schedule": self.schedule}, open(path, "w"))
-
-        path = os.path.join(outPath, FILTERED_YAML_FILE)
-        yaml.Dumper.ignore_aliases = lambda *args: True
-        yaml.dump({"schedule": [x for x in self.schedule if x.priority <= prio_level]}, open(path, "w"))
-
-        path = os.path.join(outPath, FILTERED_CSV_FILE)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'w', newline='') as csvfile:
-            w = csv.writer(csvfile,
-                           delimiter=',',
-                           quotechar='"',
-                           quoting=csv.QUOTE_MINIMAL)
-            w.writerow(['start_at', 'duration', 'path'])
-            for s in self.schedule:
-                if s.priority <= prio_level:
-                    w.writerow([s.start_at, s.duration, s.path])
-
-        path = os.path.join(outPath, ALL_CSV_FILE)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'w', newline='') as csvfile:
-            w = csv.writer(csvfile,
-                           delimiter=',',
-                           quotechar='"',
-                           quoting=csv.QUOTE_MINIMAL)
-            w.writerow(['start_at', 'duration', 'path'])
-            for s in self.schedule:
-                w.writerow([s.start_at, s.duration, s.path])
-
-
-async def main():
+        # the player reads the binary schedule, yaml and csv are human-readable exports
+        outputs = self.config["scheduling"].get("outputs", ["yaml", "csv"])
+        with self.profiler.phase("save_schedule"):
+            export_schedule(self.schedule, outPath, outputs, prio_level)
+
+    def save_profile(self):
+        self.profiler.save(self.config["scheduling"]["outDir"])
+
+
+async def main(profile: set[str] | None = None, force: bool = False) -> ScheduleBuilder | None:
+    """Build the schedule into outDir, unless it is already built from the same inputs, then return None"""
+    sb = ScheduleBuilder(profiler=Profiler(profile) if profile else None, anchor=datetime.now())
+    cache = BuildCache(sb.config["scheduling"]["outDir"])
+    fingerprint, mode = schedule_fingerprint(sb.config, sb.catalog, sb.anchor)
+    # the saved schedule must cover the horizon from now
+    until = sb.anchor + sb.horizon if sb.horizon else None
+    if not force and cache.load(fingerprint, sb.anchor, until) is not None:
+        logger.info("Schedule is unchanged, keep the built one (--force to rebuild)")
+        return None
+
     logger.info("Build schedule")
-    sb = ScheduleBuilder()
-    await sb.process_schedule()
-    await sb.save_schedule()
+    with sb.profiler.phase("build"):
+        await sb.process_schedule()
+        cache.invalidate()
+        await sb.save_schedule()
+    cache.save(fingerprint, mode, sb.anchor, sb.schedule_end)
+    sb.durations.save()
+    logger.info(f"Duration cache: {sb.durations.stats()}")
+    sb.save_profile()
+    return sb
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(profile_options(), force="--force" in sys.argv))
@@ -0,0 +1,158 @@
+"""
+Reuse the built schedule of outDir when nothing it depends on changed.
+
+The fingerprint of a build covers the scheduling config, the contents of the schedule files and the size and
+mtime of the media their sources match. Schedules whose times are all relative to the load time (no absolute
+start_at in the files) are stored with the time they were built from, and moved to the current time when read.
+Schedules mixing relative times and absolute dates depend on the load time itself, their fingerprint includes it
+and they are always rebuilt.
+Schedules built within a horizon are only reused while their window reaches the time asked by the caller.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+import yaml
+
+from src.catalog import MediaCatalog
+from src.config import BINARY_SCHEDULE_FILE, BUILD_CACHE_FILE
+from src.export import atomic_open
+from src.schedulebin import read_schedule_bin, ScheduleBinError, SCHEDULE_BIN_VERSION
+from src.scheduler_types import ScheduleClip
+from src.timeutils import is_absolute_time
+
+logger = logging.getLogger(__name__)
+
+BUILD_CACHE_VERSION = 1  # bump when the build output changes for the same inputs
+
+MODE_RELATIVE = "relative"  # all times count from the load time, the schedule is moved to the current time
+MODE_ABSOLUTE = "absolute"  # all times are dates
+MODE_ANCHORED = "anchored"  # both, the schedule is only valid for its load time
+
+SOURCE_TIME_FIELDS = ("start_at", "end_at", "clip_repeat_interval", "clip_play_duration")
+
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _file_mode(schedule: dict, sources: [dict]) -> str:
+    if is_absolute_time(schedule.get("start_at")):
+        # source times count from the file start
+        return MODE_ABSOLUTE
+    times = [schedule.get("end_at")] + [s.get(k) for s in sources for k in SOURCE_TIME_FIELDS]
+    return MODE_ANCHORED if any(is_absolute_time(x) for x in times) else MODE_RELATIVE
+
+
+def schedule_fingerprint(config: dict, catalog: MediaCatalog, anchor: datetime) -> (str | None, str):
+    """Fingerprint and mode of the build of config at anchor, no fingerprint when a schedule file can't be read"""
+    h = hashlib.sha256()
+    h.update(json.dumps({"version": BUILD_CACHE_VERSION, "schedule_bin": SCHEDULE_BIN_VERSION, "cwd": os.getcwd(),
+                         "scheduling": config["scheduling"]}, sort_keys=True, default=str).encode())
+    modes = set()
+    for path in sorted(x for x in glob.glob(config["scheduling"]["path"]) if os.path.isfile(x)):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            schedule = yaml.load(data, Loader=_Loader)
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning(f"No build fingerprint, {path} can't be read: {e}")
+            return None, MODE_ANCHORED
+        h.update(f"{path}\0".encode() + hashlib.sha256(data).digest())
+        if not isinstance(schedule, dict):
+            continue
+        sources = [x for x in schedule.get("sources") or [] if isinstance(x, dict)]
+        modes.add(_file_mode(schedule, sources))
+        for s in sources:
+            for p in catalog.glob(str(s.get("source") or "")):
+                e = catalog.entry(p)
+                h.update(f"{p}\0{e.st_size}\0{e.st_mtime_ns}\0".encode())
+
+    if modes <= {MODE_ABSOLUTE}:
+        mode = MODE_ABSOLUTE
+    elif modes == {MODE_RELATIVE}:
+        mode = MODE_RELATIVE
+    else:
+        mode = MODE_ANCHORED
+        h.update(anchor.isoformat().encode())
+    h.update(mode.encode())
+    return h.hexdigest(), mode
+
+
+def rebase_schedule(clips: [ScheduleClip], delta: timedelta) -> [ScheduleClip]:
+    if delta:
+        for c in clips:
+            c.start_at += delta
+            c.end_at += delta
+    return clips
+
+
+class BuildCache:
+    """The fingerprint of the schedule built in out_dir, saved next to it"""
+
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, BUILD_CACHE_FILE)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) and data.get("version") == BUILD_CACHE_VERSION else {}
+
+    def load(self, fingerprint: str | None, anchor: datetime,
+             until: datetime | None = None) -> list[ScheduleClip] | None:
+        """
+        The built schedule if it has the fingerprint and reaches until, relative schedules moved to anchor.
+        A schedule built within a horizon only covers the window it was built for.
+        """
+        data = self._read()
+        if not fingerprint or data.get("fingerprint") != fingerprint:
+            return None
+        built_until = self.built_until(anchor, data)
+        if built_until and until and built_until < until:
+            logger.info(f"Built schedule ends at {built_until}, before {until}")
+            return None
+        try:
+            clips = read_schedule_bin(os.path.join(self.out_dir, BINARY_SCHEDULE_FILE))
+        except (OSError, ScheduleBinError) as e:
+            logger.warning(f"Built schedule can't be reused: {e}")
+            return None
+        return self.rebase(clips, anchor, data)
+
+    @staticmethod
+    def _delta(data: dict, anchor: datetime) -> timedelta:
+        if data.get("mode") != MODE_RELATIVE:
+            return timedelta(0)
+        return anchor - datetime.fromisoformat(data["anchor"])
+
+    def built_until(self, anchor: datetime, data: dict | None = None) -> datetime | None:
+        """End of the window the saved schedule was built for, moved to anchor, None when it is complete"""
+        data = self._read() if data is None else data
+        if not data.get("built_until"):
+            return None
+        return datetime.fromisoformat(data["built_until"]) + self._delta(data, anchor)
+
+    def rebase(self, clips: [ScheduleClip], anchor: datetime, data: dict | None = None) -> [ScheduleClip]:
+        """Move a relative schedule built in out_dir to anchor"""
+        data = self._read() if data is None else data
+        return rebase_schedule(clips, self._delta(data, anchor))
+
+    def invalidate(self):
+        """Forget the fingerprint, before the schedule of out_dir is written"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def save(self, fingerprint: str | None, mode: str, anchor: datetime, built_until: datetime | None = None):
+        """built_until is the end of the window a horizon limited the schedule to, None when it is complete"""
+        if not fingerprint:
+            return
+        with atomic_open(self.path) as f:
+            json.dump({"version": BUILD_CACHE_VERSION, "fingerprint": fingerprint, "mode": mode,
+                       "anchor": anchor.isoformat(), "built_until": built_until and built_until.isoformat(),
+                       "saved_at": datetime.now().isoformat()}, f)
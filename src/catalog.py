@@ -0,0 +1,152 @@
+import fnmatch
+import glob
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class MediaEntry:
+    # named like os.stat_result fields, an entry can stand for it (e.g. for DurationCache)
+    st_size: int
+    st_mtime_ns: int
+    duration: timedelta | None = None
+
+
+@dataclass(slots=True)
+class _Directory:
+    mtime_ns: int
+    files: {str: MediaEntry} = field(default_factory=dict)
+    subdirs: {str} = field(default_factory=set)
+
+
+class MediaCatalog:
+    """
+    In-memory index of media files, shared by all sources.
+    Directories are scanned once with os.scandir, when a glob pattern first reaches them.
+    Patterns are matched against the index with the semantics of glob.glob (non-recursive, ** is *,
+    hidden files need an explicit dot), except that only files are returned.
+    refresh() rescans only the directories whose mtime changed, i.e. where files were added, removed or replaced.
+    """
+
+    def __init__(self):
+        self.directories: {str: _Directory} = {}  # absolute path -> directory
+        self.scans = 0
+        self._lock = threading.RLock()  # probing threads of several builders look entries up
+
+    def _scan(self, path: str) -> _Directory | None:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            directory = _Directory(mtime_ns)
+            with os.scandir(path) as entries:
+                for e in entries:
+                    try:
+                        if e.is_dir():
+                            directory.subdirs.add(e.name)
+                        elif e.is_file():
+                            st = e.stat()
+                            directory.files[e.name] = MediaEntry(st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        self.scans += 1
+        return directory
+
+    def _directory(self, path: str) -> _Directory | None:
+        path = os.path.abspath(path)
+        with self._lock:
+            directory = self.directories.get(path)
+            if directory is None:
+                directory = self._scan(path)
+                if directory is not None:
+                    self.directories[path] = directory
+        return directory
+
+    def entry(self, path: str) -> MediaEntry | None:
+        directory = self._directory(os.path.dirname(path) or os.curdir)
+        return directory.files.get(os.path.basename(path)) if directory else None
+
+    def glob(self, pattern: str) -> [str]:
+        """Sorted paths of the files matching the pattern, written like glob.glob would"""
+        if not glob.has_magic(pattern):
+            return [pattern] if self.entry(pattern) else []
+
+        parts = pattern.split(os.sep)
+        i = next(i for i, x in enumerate(parts) if glob.has_magic(x))
+        base = os.sep.join(parts[:i]) or (os.sep if i else "")
+        # (path as written, directory) of the directories matched so far
+        matches = [(base, self._directory(base or os.curdir))]
+        for j, part in enumerate(parts[i:], start=i):
+            last = j == len(parts) - 1
+            next_matches = []
+            for written, directory in matches:
+                if directory is None:
+                    continue
+                names = directory.files if last else directory.subdirs
+                for name in self._match(names, part):
+                    path = os.path.join(written, name)
+                    next_matches.append((path, None if last else self._directory(path)))
+            matches = next_matches
+        return sorted(x for x, _ in matches)
+
+    @staticmethod
+    def _match(names, part: str) -> [str]:
+        if not part:
+            return []
+        if not glob.has_magic(part):
+            return [part] if part in names else []
+        if not part.startswith("."):
+            names = [x for x in names if not x.startswith(".")]
+        return fnmatch.filter(names, part)
+
+    def refresh(self) -> int:
+        """Rescan directories changed since their last scan, return how many were rescanned"""
+        with self._lock:
+            rescanned = self._refresh()
+        if rescanned:
+            logger.info(f"Media catalog: rescanned {rescanned} changed directories")
+        return rescanned
+
+    def _refresh(self) -> int:
+        rescanned = 0
+        for path, directory in list(self.directories.items()):
+            if path not in self.directories:
+                # forgotten with its parent
+                continue
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                del self.directories[path]
+                continue
+            if mtime_ns == directory.mtime_ns:
+                continue
+            new = self._scan(path)
+            if new is None:
+                del self.directories[path]
+                continue
+            for name, entry in new.files.items():
+                old = directory.files.get(name)
+                if old and (old.st_size, old.st_mtime_ns) == (entry.st_size, entry.st_mtime_ns):
+                    entry.duration = old.duration
+            for name in directory.subdirs - new.subdirs:
+                self._forget(os.path.join(path, name))
+            self.directories[path] = new
+            rescanned += 1
+        return rescanned
+
+    def _forget(self, path: str):
+        prefix = path + os.sep
+        for x in [x for x in self.directories if x == path or x.startswith(prefix)]:
+            del self.directories[x]
+
+    def stats(self):
+        return {
+            "directories": len(self.directories),
+            "files": sum(len(x.files) for x in self.directories.values()),
+            "scans": self.scans
+        }
@@ -0,0 +1,184 @@
+"""
+Run several channels (outputs) from one process, or a few worker processes.
+
+Each entry of the `channels` config list overrides the `scheduling` and `vlc` settings of the config for one
+channel, typically its schedule files (`scheduling.path`), `outDir` and VLC port. Channels of a process share
+the media catalog and the duration cache. Without `channels`, the config is a single channel.
+"""
+import asyncio
+import contextlib
+import copy
+import logging
+import multiprocessing
+import os
+import signal
+from datetime import datetime
+
+import yaml
+
+from src import build, metrics, scheduler
+from src.buildcache import BuildCache, schedule_fingerprint
+from src.catalog import MediaCatalog
+from src.config import CONFIGFILE
+from src.mediacache import DurationCache
+from src.profiling import Profiler, profile_options
+
+logger = logging.getLogger(__name__)
+
+
+def merge_config(base: dict, override: dict) -> dict:
+    merged = copy.deepcopy(base)
+    for k, v in override.items():
+        if isinstance(v, dict) and isinstance(merged.get(k), dict):
+            merged[k] = merge_config(merged[k], v)
+        else:
+            merged[k] = copy.deepcopy(v)
+    return merged
+
+
+def channel_configs(config: dict) -> [(str, dict)]:
+    """(name, config) of each channel"""
+    channels = config.get("channels")
+    if not channels:
+        return [("main", config)]
+    base = {k: v for k, v in config.items() if k != "channels"}
+    configs = []
+    for i, channel in enumerate(channels):
+        name = str(channel.get("name") or f"channel{i}")
+        c = merge_config(base, {k: v for k, v in channel.items() if k != "name"})
+        if "outDir" not in channel.get("scheduling", {}):
+            c["scheduling"]["outDir"] = os.path.join(base["scheduling"]["outDir"], name)
+        configs.append((name, c))
+    return configs
+
+
+def check_ports(config: dict, channels: [(str, dict)], workers: int):
+    """Raise ValueError when two players, or a player and the metrics endpoint, would listen on the same port"""
+    owners = {}
+
+    def claim(port: int, owner: str):
+        if port in owners:
+            raise ValueError(f"Port {port} of {owner} is already used by {owners[port]}")
+        owners[port] = owner
+
+    metrics_port = (config.get("metrics") or {}).get("port")
+    if metrics_port:
+        for worker in range(workers):
+            claim(metrics_port + worker, f"the metrics of worker {worker}")
+    for name, c in channels:
+        vlc = c["vlc"]
+        for i, (port, rc_port) in enumerate(scheduler.player_ports(vlc, bool(vlc.get("preroll")))):
+            player = f"channel {name} {'preroll player' if i else 'player'}"
+            claim(port, player)
+            if vlc.get("interface") == "rc":
+                claim(rc_port, f"{player} (rc)")
+
+
+async def run_channel(name: str, config: dict, catalog: MediaCatalog, durations: DurationCache,
+                      profile: set[str] | None = None, contain: bool = False) -> bool:
+    """Build and play a channel, False if it failed and contain is set (its error is raised otherwise)"""
+    try:
+        anchor = datetime.now()
+        builder = build.ScheduleBuilder(config, catalog=catalog, durations=durations,
+                                        profiler=Profiler(profile) if profile else None, anchor=anchor)
+        cache = BuildCache(config["scheduling"]["outDir"])
+        with builder.profiler.phase("fingerprint"):
+            fingerprint, mode = schedule_fingerprint(config, catalog, anchor)
+            # the builder extends a schedule built within a horizon, it must only still be playing
+            clips = cache.load(fingerprint, anchor, anchor)
+
+        if clips is not None:
+            # the builder is only needed to extend or reload the schedule, it builds once it is
+            logger.info(f"Channel {name} is unchanged, start from its built schedule")
+            if not builder.horizon and not config["scheduling"].get("watch"):
+                builder = None
+            vs = scheduler.VideoScheduler(builder=builder, config=config, name=name, schedule=clips,
+                                          schedule_end=cache.built_until(anchor))
+        else:
+            logger.info(f"Build channel {name}")
+            with builder.profiler.phase("build"):
+                await builder.process_schedule()
+                cache.invalidate()
+                await builder.save_schedule()
+            cache.save(fingerprint, mode, anchor, builder.schedule_end)
+            durations.save()
+            builder.save_profile()
+            vs = scheduler.VideoScheduler(builder=builder, config=config, name=name)
+        logger.info(f"Start channel {name}")
+        await vs.start_scheduling(debug=False)
+    except Exception:
+        if not contain:
+            raise
+        # other channels keep playing
+        logger.exception(f"Channel {name} failed")
+        return False
+    return True
+
+
+async def run_channels(config: dict, channels: [(str, dict)], worker: int = 0, profile: set[str] | None = None):
+    """Run channels concurrently in this process, sharing the media catalog and the duration cache"""
+    catalog = MediaCatalog()
+    durations = DurationCache(build.duration_cache_path(config))
+    metrics_config = config.get("metrics") or {}
+    monitors = [asyncio.create_task(metrics.monitor_event_loop())]
+    if metrics_config.get("port"):
+        # worker processes have their own metrics, each on the next port
+        monitors.append(asyncio.create_task(
+            metrics.serve_metrics(metrics_config.get("host", "127.0.0.1"), metrics_config["port"] + worker)))
+    try:
+        # a single channel fails the process, so that it is restarted
+        contain = len(channels) > 1
+        results = await asyncio.gather(*[run_channel(name, c, catalog, durations, profile, contain)
+                                         for name, c in channels])
+        if not any(results):
+            raise RuntimeError(f"All channels failed: {', '.join(name for name, _ in channels)}")
+    finally:
+        for task in monitors:
+            task.cancel()
+        durations.save()
+        logger.info(f"Duration cache: {durations.stats()}, media catalog: {catalog.stats()}")
+
+
+async def _run_worker(config: dict, channels: [(str, dict)], worker: int, profile: set[str] | None):
+    # stop the channels on terminate(), they save their profile on the way out
+    with contextlib.suppress(NotImplementedError):  # windows
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    await run_channels(config, channels, worker, profile)
+
+
+def _run_channels_process(config: dict, channels: [(str, dict)], worker: int, profile: set[str] | None):
+    with contextlib.suppress(asyncio.CancelledError):
+        asyncio.run(_run_worker(config, channels, worker, profile))
+
+
+async def main(config: dict | None = None, profile: set[str] | None = None):
+    config = config or yaml.safe_load(open(CONFIGFILE))
+    channels = channel_configs(config)
+    workers = config["scheduling"].get("channelWorkers", 1) or os.cpu_count() or 1
+    workers = min(workers, len(channels))
+    check_ports(config, channels, workers)
+    if workers <= 1:
+        await run_channels(config, channels, profile=profile)
+        return
+
+    # each worker has its own catalog, the duration cache is shared on disk
+    logger.info(f"Run {len(channels)} channels in {workers} processes")
+    processes = [multiprocessing.Process(target=_run_channels_process, args=(config, channels[i::workers], i, profile),
+                                         name=f"channels-{i}")
+                 for i in range(workers)]
+    for p in processes:
+        p.start()
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(*[loop.run_in_executor(None, p.join) for p in processes])
+        if all(p.exitcode for p in processes):
+            raise RuntimeError(f"All {workers} channel workers failed")
+    finally:
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+                p.join()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(profile=profile_options()))
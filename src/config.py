@@ -4,7 +4,11 @@ FILTERED_CSV_FILE = "scheduled.filtered.csv"
 ALL_CSV_FILE = "scheduled.all.csv"
 FILTERED_YAML_FILE = "scheduled.filtered.yaml"
 ALL_YAML_FILE = "scheduled.all.yaml"
-VLC_PLAYLIST_INDEX_OFFSET = 3
-VLC_PLAYLIST_FILE_REVERSE_INDEXES = {}
+BINARY_SCHEDULE_FILE = "scheduled.bin"
+DURATION_CACHE_FILE = "durations.json"
+PLAYLIST_IDS_FILE = "playlist_ids.json"
+BUILD_CACHE_FILE = "build_cache.json"
+PROFILE_REPORT_FILE = "profile.json"
+PROFILE_STATS_FILE = "profile.prof"
 
 CONFIGFILE = os.getenv('CONFIG') or "config.yaml"
@@ -0,0 +1,110 @@
+import contextlib
+import csv
+import os
+import typing
+from datetime import datetime, timedelta
+
+import yaml
+
+from src.config import ALL_YAML_FILE, FILTERED_YAML_FILE, FILTERED_CSV_FILE, ALL_CSV_FILE, BINARY_SCHEDULE_FILE
+from src.schedulebin import ScheduleBinWriter
+from src.scheduler_types import ScheduleClip, _yaml_schedule_clip_representation
+
+YAML_BATCH_SIZE = 1000  # clips serialized at once, bounds memory
+
+
+class ScheduleDumper(getattr(yaml, "CDumper", yaml.Dumper)):
+    """Schedule yaml dumper, C accelerated when libyaml is available"""
+
+    def ignore_aliases(self, data):
+        return True
+
+
+ScheduleDumper.add_representer(timedelta, lambda dumper, data: dumper.represent_str(str(data)))
+ScheduleDumper.add_representer(datetime, lambda dumper, data: dumper.represent_str(data.isoformat()))
+ScheduleDumper.add_representer(ScheduleClip, _yaml_schedule_clip_representation)
+
+
+@contextlib.contextmanager
+def atomic_open(path: str, mode: str = "w", **kwargs):
+    """Write to a temporary file renamed to path on success, readers never see a half-written file"""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+class YamlScheduleWriter:
+    """Stream clips as a {"schedule": [clips]} yaml document"""
+
+    def __init__(self, f: typing.TextIO):
+        self.f = f
+        self.batch: [ScheduleClip] = []
+        self.count = 0
+
+    def write(self, c: ScheduleClip):
+        self.batch.append(c)
+        if len(self.batch) >= YAML_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        if not self.count:
+            self.f.write("schedule:\n")
+        # a block sequence at the top level is the same as under the "schedule" key
+        yaml.dump(self.batch, self.f, Dumper=ScheduleDumper)
+        self.count += len(self.batch)
+        self.batch.clear()
+
+    def close(self):
+        self.flush()
+        if not self.count:
+            self.f.write("schedule: []\n")
+
+
+class CsvScheduleWriter:
+    def __init__(self, f: typing.TextIO):
+        self.w = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        self.w.writerow(['start_at', 'duration', 'path'])
+
+    def write(self, c: ScheduleClip):
+        self.w.writerow([c.start_at, c.duration, c.path])
+
+    def close(self):
+        pass
+
+
+def export_schedule(clips: typing.Iterable[ScheduleClip], out_dir: str, outputs: [str], prio_level: int):
+    """
+    Write the binary schedule and the configured exports (yaml, csv) in a single pass over clips.
+    Filtered exports only have clips with a priority up to prio_level.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    with contextlib.ExitStack() as stack:
+        def open_output(name, writer, mode="w", **kwargs):
+            return writer(stack.enter_context(atomic_open(os.path.join(out_dir, name), mode, **kwargs)))
+
+        writers = [open_output(BINARY_SCHEDULE_FILE, ScheduleBinWriter, "wb")]
+        filtered_writers = []
+        if "yaml" in outputs:
+            writers.append(open_output(ALL_YAML_FILE, YamlScheduleWriter))
+            filtered_writers.append(open_output(FILTERED_YAML_FILE, YamlScheduleWriter))
+        if "csv" in outputs:
+            writers.append(open_output(ALL_CSV_FILE, CsvScheduleWriter, newline=''))
+            filtered_writers.append(open_output(FILTERED_CSV_FILE, CsvScheduleWriter, newline=''))
+
+        for c in clips:
+            for w in writers:
+                w.write(c)
+            if c.priority <= prio_level:
+                for w in filtered_writers:
+                    w.write(c)
+
+        for w in writers + filtered_writers:
+            w.close()
@@ -0,0 +1,190 @@
+"""
+A stand-in for the VLC HTTP interface, to run the scheduler without VLC (e.g. in CI and benchmarks).
+
+It implements the requests/status.json, requests/status.xml and requests/playlist.xml endpoints used by
+the VLC clients, with a configurable response latency and jitter.
+
+Usage: python src/fakevlc.py --port 8080 --latency 0.02 --jitter 0.01
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from urllib.parse import unquote, parse_qsl, quote
+from xml.sax.saxutils import quoteattr, escape
+
+logger = logging.getLogger(__name__)
+
+FIRST_PLAYLIST_ID = 3
+
+
+class FakeVLC:
+    def __init__(self, host="localhost", port=8080, latency=0.0, jitter=0.0, start_paused=False):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.start_paused = start_paused
+        self.playlist: {int: str} = {}
+        self.next_id = FIRST_PLAYLIST_ID
+        self.current_id: int | None = None
+        self.state = "stopped"
+        self.repeat = False
+        self.loop = False
+        self.length = 0
+        self._position = 0.0  # seconds, when paused or stopped
+        self._playing_since: float | None = None  # monotonic time the playback (re)started
+        self.commands: [(float, str, dict)] = []  # (monotonic time, command, params)
+        self.requests = 0
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def time(self) -> float:
+        if self.state == "playing" and self._playing_since is not None:
+            return self._position + time.monotonic() - self._playing_since
+        return self._position
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Fake VLC listening on {self.host}:{self.port}")
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            target = head.split(b"\r\n", 1)[0].split(b" ")[1].decode()
+            self.requests += 1
+            delay = self.latency + random.uniform(0, self.jitter)
+            if delay:
+                await asyncio.sleep(delay)
+            status, content_type, body = self._route(target)
+            writer.write((f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    def _route(self, target: str) -> (str, str, bytes):
+        path, _, query = target.partition("?")
+        # VLC clients don't urlencode parameters
+        params = dict(parse_qsl(query, keep_blank_values=True))
+        if path in ("/requests/status.json", "/requests/status.xml"):
+            if "command" in params:
+                self.command(params.pop("command"), params)
+            if path.endswith(".json"):
+                return "200 OK", "application/json", json.dumps(self.status()).encode()
+            return "200 OK", "text/xml", self._status_xml().encode()
+        if path == "/requests/playlist.xml":
+            return "200 OK", "text/xml", self._playlist_xml().encode()
+        if path == "/":
+            return "200 OK", "text/html", b"<html><title>VLC media player - Web Interface</title>VideoLAN</html>"
+        return "404 Not Found", "text/plain", b"not found"
+
+    def command(self, command: str, params: dict):
+        self.commands.append((time.monotonic(), command, params))
+        if command in ("in_enqueue", "in_play"):
+            uid = self.next_id
+            self.next_id += 1
+            self.playlist[uid] = unquote(params.get("input", ""))
+            if command == "in_play":
+                self._open(uid)
+        elif command == "pl_play":
+            uid = int(params["id"]) if params.get("id") else self.current_id or min(self.playlist, default=None)
+            if uid in self.playlist:
+                self._open(uid)
+        elif command == "pl_pause":
+            if self.state == "playing":
+                self._pause()
+            else:
+                self._resume()
+        elif command == "pl_forcepause":
+            self._pause()
+        elif command == "pl_forceresume":
+            self._resume()
+        elif command == "pl_stop":
+            self.state = "stopped"
+            self._position = 0.0
+        elif command == "pl_empty":
+            self.playlist.clear()
+        elif command == "pl_repeat":
+            self.repeat = not self.repeat
+        elif command == "pl_loop":
+            self.loop = not self.loop
+        elif command == "seek":
+            self._position = max(0.0, float(params.get("val", 0)))
+            self._playing_since = time.monotonic()
+
+    def _open(self, uid: int):
+        self.current_id = uid
+        self._position = 0.0
+        self._playing_since = time.monotonic()
+        self.state = "paused" if self.start_paused else "playing"
+
+    def _pause(self):
+        if self.state == "playing":
+            self._position = self.time
+            self.state = "paused"
+
+    def _resume(self):
+        if self.state == "paused":
+            self._playing_since = time.monotonic()
+            self.state = "playing"
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "repeat": self.repeat,
+            "loop": self.loop,
+            "currentplid": self.current_id if self.current_id is not None else -1,
+            "time": int(self.time),
+            "length": self.length,
+            "position": 0.0,
+            "version": "fake"
+        }
+
+    def _status_xml(self) -> str:
+        items = "".join(f"<{k}>{escape(str(v).lower() if isinstance(v, bool) else str(v))}</{k}>"
+                        for k, v in self.status().items())
+        return f'<?xml version="1.0" encoding="utf-8" standalone="yes" ?><root>{items}</root>'
+
+    def _playlist_xml(self) -> str:
+        leaves = []
+        for uid, p in self.playlist.items():
+            uri = p if "://" in p else "file://" + quote(os.path.abspath(p))
+            current = ' current="current"' if uid == self.current_id else ''
+            leaves.append(f'<leaf ro="rw" name={quoteattr(os.path.basename(p))} id="{uid}" duration="-1" '
+                          f'uri={quoteattr(uri)}{current}/>')
+        return ('<?xml version="1.0" encoding="utf-8" standalone="yes" ?>'
+                '<node ro="rw" name="Undefined" id="0">'
+                f'<node ro="ro" name="Playlist" id="1">{"".join(leaves)}</node>'
+                '<node ro="ro" name="Media Library" id="2"></node>'
+                '</node>')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fake VLC HTTP interface")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency in seconds")
+    parser.add_argument("--start-paused", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
+    fake = await FakeVLC(args.host, args.port, args.latency, args.jitter, args.start_paused).start()
+    await fake._server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
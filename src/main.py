@@ -1,9 +1,10 @@
 import asyncio
-from src import build, scheduler
+from src import channels
+from src.profiling import profile_options
 
 async def main():
-    await build.main()
-    await scheduler.main()
+    # --profile or VLC_SCHEDULER_PROFILE, see src/profiling.py
+    await channels.main(profile=profile_options())
 
 
 if __name__ == "__main__":
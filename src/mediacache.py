@@ -0,0 +1,113 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+from datetime import timedelta
+
+try:
+    import fcntl
+except ImportError:  # windows, channel workers may then lose each other's durations
+    fcntl = None
+
+from src.timeutils import video_duration
+
+logger = logging.getLogger(__name__)
+
+DURATION_CACHE_VERSION = 1
+
+
+class DurationCache:
+    """
+    On-disk cache of media durations, keyed by absolute path.
+    An entry is valid as long as the file size and mtime did not change.
+    """
+
+    def __init__(self, path: str | None, probe=video_duration):
+        self.path = path
+        self.probe = probe
+        self.entries: {str: [int | float]} = {}
+        self.hits = 0
+        self.misses = 0
+        self._probed: {str} = set()  # paths probed since the last save
+        self._lock = threading.Lock()
+        self.load()
+
+    def _read(self) -> {str: [int | float]}:
+        if not self.path or not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignore duration cache {self.path}: {e}")
+            return {}
+        if data.get("version") != DURATION_CACHE_VERSION:
+            logger.info(f"Ignore duration cache {self.path}: version mismatch")
+            return {}
+        return data.get("entries", {})
+
+    def load(self):
+        self.entries = self._read()
+        logger.debug(f"Loaded {len(self.entries)} cached durations from {self.path}")
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def save(self):
+        if not self.path or not self._probed:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # channel worker processes share the cache file, the durations they saved meanwhile are merged
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with self._file_lock():
+            entries = self._read()
+            with self._lock:
+                entries.update({p: self.entries[p] for p in self._probed})
+                self.entries = entries
+                self._probed = set()
+            with open(tmp_path, "w") as f:
+                json.dump({"version": DURATION_CACHE_VERSION, "entries": entries}, f)
+            os.replace(tmp_path, self.path)
+
+    def lookup(self, path: str, st: os.stat_result | None = None) -> timedelta | None:
+        """Return the cached duration if still valid, without probing"""
+        st = st or os.stat(path)
+        entry = self.entries.get(os.path.abspath(path))
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return timedelta(seconds=entry[2])
+        return None
+
+    def get(self, path: str, st: os.stat_result | None = None) -> timedelta:
+        st = st or os.stat(path)
+        duration = self.lookup(path, st)
+        if duration is not None:
+            with self._lock:
+                self.hits += 1
+            return duration
+
+        duration = self.probe(path)
+        with self._lock:
+            self.misses += 1
+            key = os.path.abspath(path)
+            self.entries[key] = [st.st_size, st.st_mtime_ns, duration.total_seconds()]
+            self._probed.add(key)
+        return duration
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,135 @@
+import os
+import struct
+
+# Lightweight duration probes reading container headers only.
+# Each probe returns the duration in seconds, or None if the format is not recognized.
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tif", ".tiff"}
+MP4_EXTENSIONS = {".mp4", ".m4v", ".mov", ".m4a", ".3gp", ".3g2"}
+MATROSKA_EXTENSIONS = {".mkv", ".webm", ".mka", ".mk3d"}
+
+_MP4_CONTAINER_BOXES = {b"moov"}
+
+_EBML_HEADER = 0x1A45DFA3
+_MKV_SEGMENT = 0x18538067
+_MKV_INFO = 0x1549A966
+_MKV_TIMECODE_SCALE = 0x2AD7B1
+_MKV_DURATION = 0x4489
+_MKV_CLUSTER = 0x1F43B675
+
+
+def is_image(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def probe_duration(path: str) -> float | None:
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        magic = f.read(8)
+        f.seek(0)
+        if magic[:4] == b"\x1a\x45\xdf\xa3" or ext in MATROSKA_EXTENSIONS:
+            return _probe_matroska(f)
+        if magic[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip") or ext in MP4_EXTENSIONS:
+            return _probe_mp4(f, os.fstat(f.fileno()).st_size)
+    return None
+
+
+def _probe_mp4(f, end: int) -> float | None:
+    while f.tell() + 8 <= end:
+        box_start = f.tell()
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack(">I4s", header)
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+        elif size == 0:
+            size = end - box_start
+        if size < 8:
+            return None
+        box_end = box_start + size
+
+        if box_type in _MP4_CONTAINER_BOXES:
+            return _probe_mp4(f, box_end)
+        if box_type == b"mvhd":
+            version = f.read(4)[0]
+            if version == 1:
+                _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+            else:
+                _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+            if not timescale or duration in (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+                return None
+            return duration / timescale
+        f.seek(box_end)
+    return None
+
+
+def _read_vint(f, keep_marker=False) -> (int | None, int):
+    first = f.read(1)
+    if not first:
+        return None, 0
+    b = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not (b & mask):
+        mask >>= 1
+        length += 1
+    if length > 8:
+        return None, 0
+    value = b if keep_marker else b & (mask - 1)
+    unknown = (b & (mask - 1)) == mask - 1
+    for c in f.read(length - 1):
+        value = (value << 8) | c
+        unknown = unknown and c == 0xFF
+    if unknown and not keep_marker:
+        return -1, length
+    return value, length
+
+
+def _read_element_header(f) -> (int | None, int | None):
+    element_id, _ = _read_vint(f, keep_marker=True)
+    if element_id is None:
+        return None, None
+    size, _ = _read_vint(f)
+    return element_id, size
+
+
+def _probe_matroska(f) -> float | None:
+    element_id, size = _read_element_header(f)
+    if element_id != _EBML_HEADER or size is None or size < 0:
+        return None
+    f.seek(size, os.SEEK_CUR)
+
+    element_id, size = _read_element_header(f)
+    if element_id != _MKV_SEGMENT:
+        return None
+
+    # walk the top level elements of the segment until Info is found
+    while True:
+        element_id, size = _read_element_header(f)
+        if element_id is None or element_id == _MKV_CLUSTER or size is None or size < 0:
+            return None
+        if element_id != _MKV_INFO:
+            f.seek(size, os.SEEK_CUR)
+            continue
+        return _probe_matroska_info(f, f.tell() + size)
+
+
+def _probe_matroska_info(f, end: int) -> float | None:
+    timecode_scale = 1_000_000
+    duration = None
+    while f.tell() < end:
+        element_id, size = _read_element_header(f)
+        if element_id is None or size is None or size < 0:
+            break
+        data = f.read(size)
+        if element_id == _MKV_TIMECODE_SCALE:
+            timecode_scale = int.from_bytes(data, "big")
+        elif element_id == _MKV_DURATION:
+            if size == 4:
+                duration = struct.unpack(">f", data)[0]
+            elif size == 8:
+                duration = struct.unpack(">d", data)[0]
+    if duration is None:
+        return None
+    return duration * timecode_scale / 1e9
@@ -0,0 +1,182 @@
+"""
+Playout metrics, kept in memory and served in the Prometheus text format.
+
+Metrics are module-level and always recorded, the HTTP endpoint is optional (`metrics.port` in the config).
+Benchmarks read them in-process with REGISTRY.snapshot().
+"""
+import asyncio
+import bisect
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+ERROR_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: {tuple: object} = {}  # sorted (label, value) pairs -> value
+
+    def render(self) -> [str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+    def snapshot(self) -> {str: object}:
+        return {_format_labels(k) or "": v for k, v in self.values.items()}
+
+    def reset(self):
+        self.values.clear()
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+
+class _HistogramValue:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        h = self.values.get(key)
+        if h is None:
+            h = self.values[key] = _HistogramValue(len(self.buckets) + 1)
+        h.counts[bisect.bisect_left(self.buckets, value)] += 1
+        h.count += 1
+        h.sum += value
+
+    def render(self) -> [str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, h in sorted(self.values.items()):
+            cumulative = 0
+            for le, n in zip((*self.buckets, math.inf), h.counts):
+                cumulative += n
+                le = "+Inf" if le == math.inf else repr(le)
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {h.sum}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {h.count}")
+        return lines
+
+    def snapshot(self) -> {str: object}:
+        return {_format_labels(k) or "": {"count": h.count, "sum": h.sum,
+                                           "buckets": dict(zip([*map(repr, self.buckets), "+Inf"], h.counts))}
+                for k, h in self.values.items()}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: {str: _Metric} = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for m in self.metrics.values() for line in m.render()) + "\n"
+
+    def snapshot(self) -> {str: {str: object}}:
+        return {name: m.snapshot() for name, m in self.metrics.items() if m.values}
+
+    def reset(self):
+        for m in self.metrics.values():
+            m.reset()
+
+
+REGISTRY = Registry()
+
+VLC_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "vlc_request_seconds", "Round-trip time of VLC commands"))
+VLC_REQUEST_ERRORS = REGISTRY.register(Counter(
+    "vlc_request_errors_total", "Failed VLC command attempts"))
+START_ERROR_SECONDS = REGISTRY.register(Histogram(
+    "playout_start_error_seconds", "Distance between the scheduled and the actual start of clips", ERROR_BUCKETS))
+TRANSITION_SECONDS = REGISTRY.register(Histogram(
+    "playout_transition_seconds", "Time to put a clip on air"))
+SEEK_ERROR_SECONDS = REGISTRY.register(Histogram(
+    "playout_seek_error_seconds",
+    "Distance between the expected and the reported player position after a start or a seek", ERROR_BUCKETS))
+DRIFT_SECONDS = REGISTRY.register(Gauge(
+    "playout_drift_seconds", "Last measured player position minus the expected one"))
+DRIFT_CORRECTIONS = REGISTRY.register(Counter(
+    "playout_drift_corrections_total", "Seeks, resumes and re-plays of the clip on air"))
+DEAD_AIR_SECONDS = REGISTRY.register(Counter(
+    "playout_dead_air_seconds_total", "Time spent with no clip on air"))
+SKIPPED_CLIPS = REGISTRY.register(Counter(
+    "playout_skipped_clips_total", "Clips skipped because they already ended"))
+EVENT_LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    "event_loop_lag_seconds", "Delay of the event loop in waking up a sleeping task"))
+
+
+async def monitor_event_loop(interval: float = 0.5):
+    """Measure how late the event loop wakes up a sleeping task, forever"""
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - t0 - interval))
+
+
+async def serve_metrics(host: str = "127.0.0.1", port: int = 9180, registry: Registry = REGISTRY):
+    """Serve the metrics on http://host:port/metrics, forever"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            target = head.split(b" ", 2)[1]
+            if target.split(b"?")[0] in (b"/metrics", b"/"):
+                status, body = "200 OK", registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write((f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Serve metrics on http://{host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,46 @@
+"""
+Tell what is on air at a given time in the built schedule.
+
+Usage: python src/onair.py ["2030-01-01 10:00:00"] [--window 30m] [--schedule build]
+"""
+import argparse
+from datetime import datetime
+
+import yaml
+
+from src.config import CONFIGFILE
+from src.scheduler import read_schedule
+from src.timeline import TimelineIndex, clip_cursor_at
+from src.timeutils import to_date, to_delta
+
+
+def describe(clip, t: datetime | None = None) -> str:
+    text = f"{clip.start_at} - {clip.end_at}  {clip.path}"
+    if t:
+        text += f"  cursor {clip_cursor_at(clip, t)}"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="What is on air at a time")
+    parser.add_argument("at", nargs="?", default=None, help="date and time, default is now")
+    parser.add_argument("--window", default=None, help="also list the clips on air in the next period, e.g. 30m")
+    parser.add_argument("--schedule", default=None, help="the folder of the built schedule, default scheduling.outDir")
+    args = parser.parse_args()
+
+    out_dir = args.schedule or yaml.safe_load(open(CONFIGFILE))["scheduling"]["outDir"]
+    timeline = TimelineIndex(read_schedule(out_dir))
+    t = to_date(args.at) if args.at else datetime.now()
+
+    clip = timeline.clip_at(t)
+    print(f"On air at {t}: {describe(clip, t) if clip else 'nothing'}")
+    if args.window:
+        for c in timeline.window(t, t + to_delta(args.window)):
+            if c is not clip:
+                print(f"  {describe(c)}")
+    elif timeline.next_after(t):
+        print(f"Next: {describe(timeline.next_after(t))}")
+
+
+if __name__ == "__main__":
+    main()
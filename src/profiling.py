@@ -0,0 +1,160 @@
+"""
+Timing report of the schedule build and the player startup.
+
+Enabled with --profile on the command line, or the VLC_SCHEDULER_PROFILE environment variable,
+e.g. --profile or --profile=cprofile,tracemalloc (VLC_SCHEDULER_PROFILE=1 or =cprofile,tracemalloc).
+Wall and CPU time are recorded per phase, schedule file, source and probed media, and written
+to outDir/profile.json. cprofile and tracemalloc capture the whole process on top of that.
+"""
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from src.config import PROFILE_REPORT_FILE, PROFILE_STATS_FILE
+from src.export import atomic_open
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV = "VLC_SCHEDULER_PROFILE"
+CAPTURES = {"cprofile", "tracemalloc"}
+TOP = 30  # slowest probes, functions and allocation sites in the report
+
+_cprofile: cProfile.Profile | None = None  # process-wide, shared by the profilers of all channels
+
+
+def profile_options(argv: list[str] | None = None) -> {str}:
+    """Options of --profile[=cprofile,tracemalloc] in argv, else of the environment, empty when disabled"""
+    argv = sys.argv[1:] if argv is None else argv
+    value = os.getenv(PROFILE_ENV, "")
+    for arg in argv:
+        if arg == "--profile":
+            value = value or "1"
+        elif arg.startswith("--profile="):
+            value = arg.split("=", 1)[1] or "1"
+    if value.lower() in ("", "0", "false", "no"):
+        return set()
+    return {"timing"} | {x.strip() for x in value.lower().split(",") if x.strip() in CAPTURES}
+
+
+def _start_capture(options: {str}):
+    global _cprofile
+    if "cprofile" in options and _cprofile is None:
+        _cprofile = cProfile.Profile()
+        _cprofile.enable()
+    if "tracemalloc" in options and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+class Profiler:
+    """
+    Wall and CPU time of the build, a disabled profiler records nothing.
+    Phases are timed with the process CPU time and may nest, files, sources and probes with the CPU time
+    of the thread (or worker process) doing the work.
+    """
+
+    def __init__(self, options: {str} = frozenset()):
+        self.options = set(options)
+        self.enabled = bool(self.options)
+        self.started_at = datetime.now()
+        self.sections: {str: dict} = {"phases": {}, "files": {}, "sources": {}, "probes": {}}
+        self._lock = threading.Lock()  # probing threads record concurrently
+        if self.enabled:
+            _start_capture(self.options)
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        return cls(profile_options([]))
+
+    def add(self, section: str, key: str, wall: float, cpu: float, part: str | None = None):
+        with self._lock:
+            entry = self.sections[section].setdefault(key, {})
+            if part:
+                entry = entry.setdefault(part, {})
+            entry["count"] = entry.get("count", 0) + 1
+            entry["wall"] = entry.get("wall", 0.0) + wall
+            entry["cpu"] = entry.get("cpu", 0.0) + cpu
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        t0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add("phases", name, time.perf_counter() - t0, time.process_time() - c0)
+
+    @contextlib.contextmanager
+    def timed(self, section: str, key: str, part: str | None = None):
+        if not self.enabled:
+            yield
+            return
+        t0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(section, key, time.perf_counter() - t0, time.thread_time() - c0, part)
+
+    def report(self) -> dict:
+        with self._lock:
+            sections = json.loads(json.dumps(self.sections))
+        by_wall = lambda item: -_total_wall(item[1])
+        report = {
+            "started_at": self.started_at.isoformat(),
+            "saved_at": datetime.now().isoformat(),
+            "options": sorted(self.options),
+            "phases": sections["phases"],
+            # slowest first
+            "files": dict(sorted(sections["files"].items(), key=by_wall)),
+            "sources": dict(sorted(sections["sources"].items(), key=by_wall)),
+            "probes": dict(sorted(sections["probes"].items(), key=by_wall)[:TOP]),
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:TOP]
+            report["memory"] = {
+                "current": current,
+                "peak": peak,
+                "top": [{"where": str(x.traceback), "size": x.size, "count": x.count} for x in top]
+            }
+        return report
+
+    def save(self, out_dir: str):
+        """Write the report, and the cProfile stats if captured, into out_dir"""
+        if not self.enabled:
+            return
+        os.makedirs(out_dir, exist_ok=True)
+        report = self.report()
+        if _cprofile is not None:
+            stats_path = os.path.join(out_dir, PROFILE_STATS_FILE)
+            _cprofile.dump_stats(stats_path)
+            # dumping stops the profiler
+            _cprofile.enable()
+            report["cprofile"] = {"stats": stats_path, "top": _top_functions(pstats.Stats(stats_path))}
+        path = os.path.join(out_dir, PROFILE_REPORT_FILE)
+        with atomic_open(path) as f:
+            json.dump(report, f, indent=2)
+        phases = ", ".join(f"{k} {v['wall']:.3f}s" for k, v in report["phases"].items())
+        files = ", ".join(f"{k} {_total_wall(v):.3f}s" for k, v in list(report["files"].items())[:3])
+        logger.info(f"Profile written to {path}: {phases}; slowest files: {files or '-'}")
+
+
+def _total_wall(entry: dict) -> float:
+    if "wall" in entry:
+        return entry["wall"]
+    return sum(x["wall"] for x in entry.values() if isinstance(x, dict) and "wall" in x)
+
+
+def _top_functions(stats: pstats.Stats) -> [dict]:
+    rows = sorted(stats.stats.items(), key=lambda x: -x[1][3])[:TOP]
+    return [{"function": f"{file}:{line}({name})", "calls": nc, "tottime": tt, "cumtime": ct}
+            for (file, line, name), (cc, nc, tt, ct, callers) in rows]
@@ -0,0 +1,94 @@
+import mmap
+import os
+import struct
+import typing
+
+from src.scheduler_types import ScheduleClip
+from src.timeutils import to_us, date_from_us, delta_from_us
+
+# Binary schedule, the artifact the player loads at startup.
+#
+# header   magic, version, record size, clip count, offset and size of the path table
+# records  one fixed-width record per clip, ordered by start time
+# paths    the interned path table, each path is a uint32 length followed by utf-8 bytes
+#
+# Times are int64 microseconds, see timeutils.to_us.
+# The header is written last, a file with an incomplete header is rejected.
+
+SCHEDULE_BIN_MAGIC = b"VLCSCHED"
+SCHEDULE_BIN_VERSION = 1
+
+_HEADER = struct.Struct("<8sHHIQQQ")  # magic, version, record size, reserved, count, paths offset, paths size
+# start_at, end_at, duration, play_duration, cursor_start_at, cursor_end_at, priority, path index, loop
+_RECORD = struct.Struct("<6qiI?7x")
+_PATH_LENGTH = struct.Struct("<I")
+
+
+class ScheduleBinError(ValueError):
+    pass
+
+
+class ScheduleBinWriter:
+    """Stream clips to a binary file object, close() completes the file"""
+
+    def __init__(self, f: typing.BinaryIO):
+        self.f = f
+        self.path_indexes: {str: int} = {}
+        self.count = 0
+        self.f.write(bytes(_HEADER.size))
+
+    def write(self, c: ScheduleClip):
+        path_index = self.path_indexes.setdefault(c.path, len(self.path_indexes))
+        self.f.write(_RECORD.pack(to_us(c.start_at), to_us(c.end_at), to_us(c.duration),
+                                  to_us(c.play_duration), to_us(c.cursor_start_at), to_us(c.cursor_end_at),
+                                  c.priority, path_index, bool(c.loop)))
+        self.count += 1
+
+    def close(self):
+        paths_offset = self.f.tell()
+        for p in self.path_indexes:
+            data = p.encode()
+            self.f.write(_PATH_LENGTH.pack(len(data)) + data)
+        paths_size = self.f.tell() - paths_offset
+
+        self.f.seek(0)
+        self.f.write(_HEADER.pack(SCHEDULE_BIN_MAGIC, SCHEDULE_BIN_VERSION, _RECORD.size, 0, self.count,
+                                  paths_offset, paths_size))
+
+
+def _read_paths(buffer, offset: int, size: int) -> [str]:
+    paths = []
+    end = offset + size
+    while offset < end:
+        length, = _PATH_LENGTH.unpack_from(buffer, offset)
+        offset += _PATH_LENGTH.size
+        paths.append(bytes(buffer[offset:offset + length]).decode())
+        offset += length
+    return paths
+
+
+def read_schedule_bin(path: str) -> [ScheduleClip]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise ScheduleBinError(f"{path} is truncated")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            magic, version, record_size, _, count, paths_offset, paths_size = _HEADER.unpack_from(m)
+            if magic != SCHEDULE_BIN_MAGIC:
+                raise ScheduleBinError(f"{path} is not a binary schedule")
+            if version != SCHEDULE_BIN_VERSION or record_size != _RECORD.size:
+                raise ScheduleBinError(f"{path} has an unsupported version {version}")
+            if _HEADER.size + count * record_size != paths_offset or paths_offset + paths_size > len(m):
+                raise ScheduleBinError(f"{path} is truncated")
+
+            paths = _read_paths(m, paths_offset, paths_size)
+            view = memoryview(m)[_HEADER.size:paths_offset]
+            try:
+                return [ScheduleClip(path=paths[path_index], priority=priority, loop=loop,
+                                     start_at=date_from_us(start_at), end_at=date_from_us(end_at),
+                                     duration=delta_from_us(duration), play_duration=delta_from_us(play_duration),
+                                     cursor_start_at=delta_from_us(cursor_start_at),
+                                     cursor_end_at=delta_from_us(cursor_end_at))
+                        for start_at, end_at, duration, play_duration, cursor_start_at, cursor_end_at, priority,
+                        path_index, loop in _RECORD.iter_unpack(view)]
+            finally:
+                view.release()
@@ -1,32 +1,101 @@
 import asyncio
+import contextlib
+import heapq
+import json
 import sys
+import time
 import typing
 from datetime import datetime, timedelta
 import glob
 import os
 from asyncio import PriorityQueue, QueueEmpty
+from collections import deque
 from dataclasses import dataclass, Field, field, asdict, replace
 
 import yaml
 import logging
 
-from src import build
-from src.config import ALL_YAML_FILE, CONFIGFILE, VLC_PLAYLIST_FILE_REVERSE_INDEXES, VLC_PLAYLIST_INDEX_OFFSET
+from src import build, metrics
+from src.buildcache import BuildCache
+from src.config import ALL_YAML_FILE, BINARY_SCHEDULE_FILE, CONFIGFILE, PLAYLIST_IDS_FILE
+from src.profiling import Profiler, profile_options
 from src.timeutils import to_date, to_delta
+from src.schedulebin import read_schedule_bin, ScheduleBinError
+from src.timeline import TimelineIndex, clip_cursor_at
 from src.scheduler_types import ScheduleClip, ScheduleFile, ScheduleSource
-from vlc import VLCLauncher, VLCHTTPClient
+from src.watcher import ScheduleWatcher
+from vlc import VLCError, VLCLauncher, create_vlc_client
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)-8s %(message)s')
 logger = logging.getLogger(__name__)
 
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
+DEADLINE_START = "start"
+DEADLINE_STOP = "stop"
+DEADLINE_PREROLL = "preroll"
+PREROLL_MAX_LATE = 0.5  # seconds, a prerolled clip started later than this is seeked again
+MAX_SLEEP_TIME = 5.0  # seconds, guards against wall clock changes
+START_LATENCY_WINDOW = 50  # last clip starts the command latency is learned from
+START_LEAD_PERCENTILE = 0.5
+MAX_START_LEAD = 1.0  # seconds
+DRIFT_CHECK_MIN_INTERVAL = 0.25  # seconds, between player status samples after a start or a correction
+
+
+def player_ports(vlc_config: dict, preroll: bool) -> [(int, int | None)]:
+    """(HTTP port, RC port) of the players of a channel, the preroll player defaults to the next ports"""
+    ports = [(vlc_config["port"], vlc_config.get("rc_port"))]
+    if preroll:
+        ports.append((vlc_config.get("preroll_port") or vlc_config["port"] + 1,
+                      vlc_config.get("preroll_rc_port") or (vlc_config.get("rc_port") or 0) + 1))
+    return ports
+
+
+def read_schedule_yaml(schedule_path: str) -> [ScheduleClip]:
+    data = yaml.safe_load(open(schedule_path))
+    clips = []
+    for clip_data in data["schedule"]:
+        c = ScheduleClip(**clip_data)
+        c.start_at = to_date(c.start_at)
+        c.end_at = to_date(c.end_at)
+        c.cursor_start_at = to_delta(c.cursor_start_at)
+        c.cursor_end_at = to_delta(c.cursor_end_at)
+        c.duration = to_delta(c.duration)
+        clips.append(c)
+    return clips
+
+
+def read_schedule(out_dir: str) -> [ScheduleClip]:
+    """Read the built schedule, the binary one if available"""
+    schedule_path = os.path.join(out_dir, BINARY_SCHEDULE_FILE)
+    if os.path.isfile(schedule_path):
+        try:
+            return read_schedule_bin(schedule_path)
+        except ScheduleBinError as e:
+            logger.warning(f"Fall back to the yaml schedule: {e}")
+    return read_schedule_yaml(os.path.join(out_dir, ALL_YAML_FILE))
+
 
 class VideoScheduler:
 
-    def __init__(self):
-        self.config = yaml.safe_load(open(CONFIGFILE))
-        self.clips = []
+    def __init__(self, builder: build.ScheduleBuilder | None = None, config: dict | None = None, name: str = "main",
+                 profiler: Profiler | None = None, schedule: list[ScheduleClip] | None = None,
+                 schedule_end: datetime | None = None):
+        """
+        With a schedule (e.g. the one built by a previous run), it is played at once, the builder only builds
+        when it is needed: to extend the horizon of the schedule (built until schedule_end, None when complete)
+        or to reload a changed schedule file.
+        """
+        self.config = config or yaml.safe_load(open(CONFIGFILE))
+        self.name = name  # channel, labels the metrics
+        self.builder = builder
+        self.initial_schedule = schedule
+        self.initial_schedule_end = schedule_end
+        self.builder_ready = asyncio.Event()  # the builder built the schedule
+        self.build_lock = asyncio.Lock()
+        self.profiler = profiler or (builder.profiler if builder else Profiler.from_env())
+        self.timeline = TimelineIndex([])
+        self.next_index = 0  # index in timeline of the next clip to air
         self.tasks = []
         self.active = True
         self.group_start_timestamp_schedule = PriorityQueue()
@@ -35,139 +104,552 @@ class VideoScheduler:
         self.clip_on_air: ScheduleClip | None = None
         self.clip_on_wait: [ScheduleClip] = []
         self.vlc_clip_playlist_id: {} = {}
-        self.polling_time = self.config["scheduling"]["polling_time"]
+        self.wakeup = asyncio.Event()
+        self.vlc_launchers: [VLCLauncher] = []
+        self.players = []
+        self.preroll_time = to_delta(self.config["vlc"].get("preroll_time"), default=timedelta(seconds=2)) \
+            if self.config["vlc"].get("preroll") else None
+        self.clip_prerolled: ScheduleClip | None = None
+        self.clip_preroll_tried: ScheduleClip | None = None  # prerolled or failed to, it isn't tried again
+        self.start_errors: deque[float] = deque(maxlen=1000)
+        self.transitions: deque[(int, float)] = deque(maxlen=1000)  # round-trips and seconds of each clip start
+        # clips are started early by the usual time their commands take, to be on air on time
+        self.latency_compensation = self.config["vlc"].get("latency_compensation", True)
+        # seconds until a clip is on air: resume of a prerolled player ("cut") or play and seek ("play")
+        self.start_latencies: {str: deque[float]} = {
+            "cut": deque(maxlen=START_LATENCY_WINDOW),
+            "play": deque(maxlen=START_LATENCY_WINDOW)
+        }
+        self.dead_air_since: datetime | None = None
+        # 0 disables the supervision of the clip on air
+        self.max_drift = to_delta(self.config["vlc"].get("max_drift", "2s")).total_seconds()
+        self.drift_check_interval = to_delta(self.config["vlc"].get("drift_check_interval"),
+                                             default=timedelta(seconds=0.5)).total_seconds()
+        self.player_lock = asyncio.Lock()  # player commands of a transition or a correction don't interleave
+        self.on_air_changed = asyncio.Event()
 
     async def load_schedule(self):
-        schedule_path = os.path.join(self.config["scheduling"]["outDir"], ALL_YAML_FILE)
-        data = yaml.safe_load(open(schedule_path))
-        for clip_data in data["schedule"]:
-            c = ScheduleClip(**clip_data)
-            c.start_at = to_date(c.start_at)
-            c.end_at = to_date(c.end_at)
-            c.cursor_start_at = to_delta(c.cursor_start_at)
-            c.cursor_end_at = to_delta(c.cursor_end_at)
-            c.duration = to_delta(c.duration)
-            if (c.path not in VLC_PLAYLIST_FILE_REVERSE_INDEXES):
-                self.vlc_client.enqueue(c.path)
-                VLC_PLAYLIST_FILE_REVERSE_INDEXES[c.path] \
-                    = c.vlc_playlist_id \
-                    = len(VLC_PLAYLIST_FILE_REVERSE_INDEXES) + VLC_PLAYLIST_INDEX_OFFSET
+        with self.profiler.phase("load_schedule"):
+            if self.initial_schedule is not None:
+                self.update_schedule(await self._sync_playlists(self.initial_schedule))
+                return
+            if self.builder:
+                # the builder keeps the schedule up to date, see task_extend_schedule
+                self.update_schedule(await self._sync_playlists(self.builder.schedule))
+                return
+
+            out_dir = self.config["scheduling"]["outDir"]
+            with self.profiler.phase("read_schedule"):
+                # relative schedules start now
+                clips = BuildCache(out_dir).rebase(read_schedule(out_dir), datetime.now())
+            self.update_schedule(await self._sync_playlists(clips))
+
+    async def _sync_playlists(self, clips: [ScheduleClip]) -> [ScheduleClip]:
+        """Make sure the clip paths are in the playlist of every player, and set their playlist ids"""
+        with self.profiler.phase("sync_playlists"):
+            paths = sorted({c.path for c in clips})
+            path = os.path.join(self.config["scheduling"]["outDir"], PLAYLIST_IDS_FILE)
+            saved_ids = self._read_playlist_ids(path)
+            changed = False
+            for player in self.players:
+                if all(p in player.playlist_ids for p in paths):
+                    continue
+                endpoint = f"{player.host}:{player.port}"
+                t0 = time.perf_counter()
+                enqueued = await player.sync_playlist(paths, saved_ids.get(endpoint))
+                logger.info(f"Synced playlist of {endpoint}: {len(paths)} paths, {enqueued} enqueued, "
+                            f"{(time.perf_counter() - t0) * 1000:.1f} ms")
+                saved_ids[endpoint] = player.playlist_ids
+                changed = True
+            if changed:
+                self._write_playlist_ids(path, saved_ids)
+
+            for c in clips:
+                c.vlc_playlist_id = self.vlc_client.playlist_ids[c.path]
+            return clips
+
+    @staticmethod
+    def _read_playlist_ids(path: str) -> {str: {str: int}}:
+        """Playlist ids of each player endpoint, saved by the previous runs"""
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_playlist_ids(path: str, playlist_ids: {str: {str: int}}):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(playlist_ids, f)
+        os.replace(tmp_path, path)
+
+    @property
+    def idle_player(self):
+        return next((x for x in self.players if x is not self.vlc_client), None)
+
+    async def _preroll(self, clip: ScheduleClip):
+        """Open, seek and pause the clip on the idle player, ready to be cut to at its start time"""
+        player = self.idle_player
+        self.clip_preroll_tried = clip
+        t0 = time.perf_counter()
+        try:
+            round_trips = await player.switch(player.playlist_ids[clip.path], clip.cursor_start_at.total_seconds(),
+                                              clip.loop)
+            round_trips += 1
+            await player.force_pause()
+        except VLCError as e:
+            # the clip is played instead of cut to
+            logger.warning(f"Preroll failed: {e}")
+            return
+        self.clip_prerolled = clip
+        logger.info(f"Preroll clip: {clip.path} in {round_trips} round-trips, "
+                    f"{(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    def _is_cut(self, clip: ScheduleClip, now: datetime) -> bool:
+        """The clip is started by resuming its prerolled player"""
+        return self.clip_prerolled is clip and (now - clip.start_at).total_seconds() < PREROLL_MAX_LATE
+
+    def start_lead(self, clip: ScheduleClip, now: datetime) -> timedelta:
+        """How long before its start time a clip is started, the usual latency of its start commands"""
+        if not self.latency_compensation:
+            return timedelta(0)
+        latencies = sorted(self.start_latencies["cut" if self._is_cut(clip, now) else "play"])
+        if not latencies:
+            return timedelta(0)
+        lead = latencies[int(len(latencies) * START_LEAD_PERCENTILE)]
+        return timedelta(seconds=min(lead, MAX_START_LEAD))
+
+    async def _play(self, clip: ScheduleClip, now: datetime, lead: timedelta) -> (int, datetime):
+        """Put the clip on air, return the number of round-trips and when the player switched to it"""
+        if self._is_cut(clip, now):
+            # cut to the prerolled player, then stop the other one
+            player = self.idle_player
+            t0 = time.perf_counter()
+            await player.resume()
+            on_air_at = datetime.now()
+            self.start_latencies["cut"].append(time.perf_counter() - t0)
+            previous, self.vlc_client = self.vlc_client, player
+            self.clip_prerolled = None
+            try:
+                await previous.stop()
+            except VLCError as e:
+                logger.warning(f"Stop of the previous player failed: {e}")
+            return 2, on_air_at
+
+        player = self.vlc_client
+        # seek where the clip is once the commands went through
+        cursor = clip_cursor_at(clip, max(clip.start_at, now + lead)).total_seconds()
+        if cursor > clip.duration.total_seconds():
+            logger.warning(f"Cursor is bigger than duration")
+        logger.info(f"Play clip: {clip.path} seek={player.seek_value(cursor)}")
+        t0 = time.perf_counter()
+        round_trips = await self._switch(player, clip, cursor)
+        self.start_latencies["play"].append(time.perf_counter() - t0)
+        return round_trips, datetime.now()
+
+    async def _switch(self, player, clip: ScheduleClip, cursor: float) -> int:
+        round_trips = await player.switch(player.playlist_ids[clip.path], cursor, clip.loop)
+        if self.preroll_time:
+            # players start paused when prerolling
+            await player.resume()
+            round_trips += 1
+        return round_trips
+
+    def update_schedule(self, clips: [ScheduleClip]):
+        """
+        Swap the schedule with a new one, ordered by start time.
+        The clip on air keeps playing if the new schedule airs the same clip at the same cursor.
+        """
+        now = datetime.now()
+        self.timeline = TimelineIndex(clips)
+        # jump to the clip on air now, ended clips are never visited
+        self.next_index = self.timeline.index_at(now)
+        on_air = self.clip_on_air
+        if on_air:
+            if self.next_clip and self._is_same_airing(on_air, self.next_clip, now):
+                self.clip_on_air = self.next_clip
+                self.next_index += 1
             else:
-                c.vlc_playlist_id = VLC_PLAYLIST_FILE_REVERSE_INDEXES[c.path]
+                logger.info(f"Clip on air {on_air.path} is no more scheduled")
+                on_air.end_at = min(on_air.end_at, now)
+        self.wake("schedule updated")
 
-            self.clips.append(c)
+    @property
+    def next_clip(self) -> ScheduleClip | None:
+        return self.timeline[self.next_index] if self.next_index < len(self.timeline) else None
 
-    async def schedule_clip(self, clip: ScheduleClip):
-        assert clip.vlc_playlist_id
-        self.vlc_client.stop()
-        self.vlc_client.play(clip.vlc_playlist_id)
-        self.vlc_client.repeat(clip.loop)
-        self.clip_on_air = clip
+    @staticmethod
+    def _is_same_airing(a: ScheduleClip, b: ScheduleClip, now: datetime) -> bool:
+        if a.path != b.path or a.loop != b.loop or b.start_at > now:
+            return False
+        # the cursor of both clips at the same time
+        cursor_delta = (a.cursor_start_at - b.cursor_start_at) - (a.start_at - b.start_at)
+        return abs(cursor_delta.total_seconds()) < 0.5
 
-    async def task_schedule_clips(self):
-        clips_to_air: [ScheduleClip] = [*self.clips]
-        next_clip: ScheduleClip | None = None
-        while clips_to_air or self.clip_on_air:
+    @property
+    def more_to_build(self) -> bool:
+        """The builder will extend the schedule"""
+        if not self.builder or not self.builder.horizon:
+            return False
+        if not self.builder_ready.is_set():
+            return self.initial_schedule_end is not None
+        return not self.builder.exhausted
 
+    async def build_schedule(self, reason: str):
+        """Build the schedule the initial one came from, once, and swap it in"""
+        async with self.build_lock:
+            if self.builder_ready.is_set():
+                return
+            logger.info(f"Build schedule: {reason}")
+            await self.builder.process_schedule()
+            self.update_schedule(await self._sync_playlists(self.builder.schedule))
+            self.builder_ready.set()
+
+    async def task_extend_schedule(self):
+        """Keep a rolling horizon of built clips ahead of now"""
+        builder = self.builder
+        horizon = builder.horizon
+        if not self.builder_ready.is_set():
+            if not self.initial_schedule_end:
+                # the initial schedule is complete, it is only rebuilt when a schedule file changes
+                await self.builder_ready.wait()
+            else:
+                # it is extended like a built one, once half of its horizon played
+                extend_at = self.initial_schedule_end - horizon / 2
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.builder_ready.wait(),
+                                           max(0.0, (extend_at - datetime.now()).total_seconds()))
+                await self.build_schedule("extend the horizon")
+        while self.active and not builder.exhausted:
+            extend_at = builder.built_until - horizon / 2
+            await asyncio.sleep(max(0.0, (extend_at - datetime.now()).total_seconds()))
+            await builder.extend_schedule(datetime.now() + horizon)
+            self.update_schedule(await self._sync_playlists(builder.schedule))
+
+    async def task_watch_schedule(self):
+        """Rebuild changed schedule files and swap them into the running schedule"""
+        watcher = ScheduleWatcher(self.config["scheduling"]["path"])
+        async for changed, removed in watcher.changes():
+            logger.info(f"Reload schedule, changed: {sorted(changed)}, removed: {sorted(removed)}")
+            if not self.builder_ready.is_set():
+                # the first build reads the changed files
+                await self.build_schedule("schedule files changed")
+                continue
+            try:
+                await self.builder.reload_schedule_files(changed, removed)
+            except (TypeError, ValueError, OSError, yaml.YAMLError) as e:
+                logger.warning(f"Reload failed: {e}")
+                continue
+            self.update_schedule(await self._sync_playlists(self.builder.schedule))
+
+    def save_profile(self):
+        """
+        Only at startup and shutdown: the cProfile stats and the tracemalloc snapshot are taken on the event loop
+        and would delay clip starts.
+        """
+        try:
+            self.profiler.save(self.config["scheduling"]["outDir"])
+        except OSError as e:
+            logger.warning(f"Profile not saved: {e}")
+
+    def wake(self, reason: str):
+        """Wake the scheduling loop before its next deadline, e.g. after a schedule or player change"""
+        logger.debug(f"Wake scheduler: {reason}")
+        self.wakeup.set()
+
+    def _next_deadline(self) -> tuple[datetime, str] | None:
+        deadlines = []
+        if self.clip_on_air:
+            heapq.heappush(deadlines, (self.clip_on_air.end_at, DEADLINE_STOP))
+        next_clip = self.next_clip
+        if next_clip:
+            heapq.heappush(deadlines, (next_clip.start_at - self.start_lead(next_clip, datetime.now()), DEADLINE_START))
+            if self.preroll_time and self.clip_preroll_tried is not next_clip:
+                heapq.heappush(deadlines, (next_clip.start_at - self.preroll_time, DEADLINE_PREROLL))
+        return deadlines[0] if deadlines else None
+
+    async def _sleep_until(self, deadline: datetime | None):
+        timeout = MAX_SLEEP_TIME
+        if deadline:
+            timeout = min(timeout, max(0.0, (deadline - datetime.now()).total_seconds()))
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.wakeup.clear()
+
+    def _track_dead_air(self, now: datetime):
+        """Count the time spent since the last call if nothing was on air"""
+        if self.dead_air_since:
+            metrics.DEAD_AIR_SECONDS.inc(max(0.0, (now - self.dead_air_since).total_seconds()), channel=self.name)
+        self.dead_air_since = None if self.clip_on_air else now
+
+    def start_error_stats(self) -> {str: float}:
+        """Percentiles in seconds of the measured clip start delays"""
+        errors = sorted(self.start_errors)
+        if not errors:
+            return {}
+        return {
+            "count": len(errors),
+            "p50": errors[len(errors) // 2],
+            "p95": errors[min(len(errors) - 1, int(len(errors) * 0.95))],
+            "max": errors[-1]
+        }
+
+    async def task_schedule_clips(self):
+        while (self.next_clip or self.clip_on_air
+               or self.more_to_build):
             now = datetime.now()
-            curr_clip = self.clip_on_air
-            if clips_to_air and clips_to_air[0] is not next_clip:
-                next_clip = clips_to_air[0]
-                logger.debug(f"Next clip: {next_clip.path}, scheduled at {next_clip.start_at}")
+            self._track_dead_air(now)
 
             # skip already ended
-            while clips_to_air and now > next_clip.end_at:
-                discarded = clips_to_air.pop(0)
-                logger.debug(f"Discard clip: {discarded.path} ends at {discarded.end_at}")
-                if clips_to_air:
-                    next_clip = clips_to_air[0]
+            while self.next_clip and now > self.next_clip.end_at:
+                logger.debug(f"Discard clip: {self.next_clip.path} ends at {self.next_clip.end_at}")
+                metrics.SKIPPED_CLIPS.inc(channel=self.name)
+                self.next_index += 1
+
+            next_clip = self.next_clip
+            lead = self.start_lead(next_clip, now) if next_clip else timedelta(0)
+            next_clip_is_due = next_clip and now >= next_clip.start_at - lead
 
-            if curr_clip and now > curr_clip.end_at:
+            curr_clip = self.clip_on_air
+            if curr_clip and now >= curr_clip.end_at:
                 logger.debug(f"Stop clip: {curr_clip.path}")
-                self.vlc_client.stop()
+                if not next_clip_is_due:
+                    # no need to stop a clip immediately replaced
+                    async with self.player_lock:
+                        try:
+                            await self.vlc_client.stop()
+                        except VLCError as e:
+                            logger.warning(f"Stop failed: {e}")
                 self.clip_on_air = None
-                curr_clip = None
-
-            if next_clip and now > next_clip.start_at:
-                if clips_to_air:
-                    clips_to_air.pop(0)
-                cursor = round((next_clip.cursor_start_at + (now - next_clip.start_at)).total_seconds())
-                if cursor > next_clip.duration.total_seconds():
-                    logger.warning(f"Cursor is bigger than duration")
-                logger.info(f"Play clip: {next_clip.path} seek={cursor}")
-                self.vlc_client.play(next_clip.vlc_playlist_id)
-                self.vlc_client.seek(cursor)
-                self.vlc_client.repeat(next_clip.loop)
+                self.on_air_changed.set()
+
+            if next_clip_is_due:
+                self.next_index += 1
+                logger.info(f"Start clip: {next_clip.path} late={(now - next_clip.start_at).total_seconds():.3f}s "
+                            f"lead={lead.total_seconds():.3f}s")
+                t0 = time.perf_counter()
+                try:
+                    async with self.player_lock:
+                        round_trips, on_air_at = await self._play(next_clip, now, lead)
+                except VLCError as e:
+                    # on air all the same, the supervision plays it again
+                    logger.warning(f"Start failed: {e}")
+                    self.clip_on_air = next_clip
+                    self.on_air_changed.set()
+                    continue
+                elapsed = time.perf_counter() - t0
+                # negative when early
+                start_error = (on_air_at - next_clip.start_at).total_seconds()
+                self.start_errors.append(start_error)
+                self.transitions.append((round_trips, elapsed))
+                metrics.START_ERROR_SECONDS.observe(abs(start_error), channel=self.name)
+                metrics.TRANSITION_SECONDS.observe(elapsed, channel=self.name)
+                logger.info(f"Transition in {round_trips} round-trips, {elapsed * 1000:.1f} ms, "
+                            f"on air {start_error * 1000:+.1f} ms from schedule")
                 self.clip_on_air = next_clip
-                next_clip = None
+                self._track_dead_air(datetime.now())
+                self.on_air_changed.set()
+                continue
+
+            if (self.preroll_time and next_clip and self.clip_preroll_tried is not next_clip
+                    and now >= next_clip.start_at - self.preroll_time):
+                await self._preroll(next_clip)
+                continue
 
-            await asyncio.sleep(self.polling_time or 0.5)
+            self._track_dead_air(datetime.now())
+            deadline = self._next_deadline()
+            if deadline:
+                logger.debug(f"Next deadline: {deadline[1]} at {deadline[0]}")
+            await self._sleep_until(deadline[0] if deadline else None)
 
-        logger.info(f"No more clips to air")
+        logger.info(f"No more clips to air, start errors: {self.start_error_stats()}")
+        self.active = False
+        self.on_air_changed.set()
 
-    async def _check_clip_on_air(self):
-        c = self.clip_on_air
-        vlc_status = self.vlc_client.status()
-        c.cursor = vlc_status["time"]
+    async def task_supervise_clip_on_air(self):
+        """
+        Keep the player on air in line with the timeline: re-seek it when it drifts by more than max_drift,
+        re-play the clip when it stopped, paused or plays another item.
+        The status is sampled often after a start or a correction, then less and less up to drift_check_interval
+        while the player keeps time. Drifts, and stops before the player was seen in sync, are corrected when seen
+        twice in a row: transient states (e.g. an input being opened) are not.
+        """
+        interval = DRIFT_CHECK_MIN_INTERVAL
+        pending = None  # correction seen once
+        first_sample = False
+        in_sync = False  # the player was seen in sync since the last start or correction
+        while self.active:
+            try:
+                await asyncio.wait_for(self.on_air_changed.wait(), interval)
+                self.on_air_changed.clear()
+                interval, pending, first_sample, in_sync = DRIFT_CHECK_MIN_INTERVAL, None, True, False
+                continue
+            except asyncio.TimeoutError:
+                pass
+            clip = self.clip_on_air
+            if not clip:
+                interval = self.drift_check_interval
+                continue
 
-        stop = False
+            action = await self._check_clip_on_air(clip, first_sample)
+            first_sample = False
+            if action and (action == pending or (in_sync and action != "seek")):
+                await self._correct_clip_on_air(clip, action)
+                interval, pending, first_sample, in_sync = DRIFT_CHECK_MIN_INTERVAL, None, True, False
+            elif action:
+                interval, pending = DRIFT_CHECK_MIN_INTERVAL, action
+            else:
+                interval, pending, in_sync = min(interval * 2, self.drift_check_interval), None, True
+
+    async def _check_clip_on_air(self, clip: ScheduleClip, first_sample: bool) -> str | None:
+        """The correction the player needs to air the clip as scheduled: seek, resume, play or None"""
+        player = self.vlc_client
+        t0 = datetime.now()
+        try:
+            status = await player.status()
+        except VLCError as e:
+            logger.warning(f"Player status failed: {e}")
+            return None
+        # the player answered somewhere during the round-trip
+        now = t0 + (datetime.now() - t0) / 2
+        if self.clip_on_air is not clip or self.vlc_client is not player:
+            return None
 
-        if not stop and vlc_status["state"] == "stopped":
-            c.cursor = 0
-            if c.parent.clip_play_duration:
-                c.cursor_stop_at = c.parent.clip_play_duration.total_seconds()
-            stop = True
+        expected = clip_cursor_at(clip, now).total_seconds()
+        duration = clip.duration.total_seconds()
+        # the media may end on its own right before the clip
+        ending = (clip.end_at - now).total_seconds() < 1 or (not clip.loop and expected > duration - 1)
+        # the rc interface doesn't tell the current item
+        same_item = status.get("currentplid", -1) in (-1, player.playlist_ids.get(clip.path))
+        state = status.get("state")
+        if state == "playing" and same_item:
+            drift = self._player_position(status) - expected
+            if clip.loop and duration:
+                drift = (drift + duration / 2) % duration - duration / 2
+            metrics.DRIFT_SECONDS.set(drift, channel=self.name)
+            if first_sample:
+                # verify the start
+                metrics.SEEK_ERROR_SECONDS.observe(abs(drift), channel=self.name)
+                logger.debug(f"Clip on air at {expected + drift:.2f}s, expected {expected:.2f}s: {clip.path}")
+            if abs(drift) <= self.max_drift or ending:
+                return None
+            logger.warning(f"Clip on air drifts by {drift:.1f}s: {clip.path}")
+            return "seek"
+        if ending:
+            return None
+        logger.warning(f"Clip on air is not playing, player is {state if same_item else 'on another item'}: "
+                       f"{clip.path}")
+        return "resume" if state == "paused" and same_item else "play"
 
-        if not stop and c.cursor_stop_at and c.cursor >= c.cursor_stop_at:
-            c.cursor_stop_at += c.parent.clip_play_duration.total_seconds()
-            self.vlc_client.pause()
-            stop = True
+    @staticmethod
+    def _player_position(status: dict) -> float:
+        """Seconds played of the current item"""
+        # VLC truncates the time and the length to whole seconds
+        time_ = status.get("time") or 0
+        length, position = status.get("length") or 0, status.get("position") or 0
+        estimate = position * length
+        if length and position and time_ <= estimate < time_ + 1:
+            # the relative position is a float, it refines the time unless the length truncation shows
+            return estimate
+        return time_ + 0.5
 
-        return not stop
+    async def _correct_clip_on_air(self, clip: ScheduleClip, action: str):
+        async with self.player_lock:
+            if self.clip_on_air is not clip:
+                return
+            player = self.vlc_client
+            cursor = clip_cursor_at(clip, datetime.now()).total_seconds()
+            logger.info(f"Correct clip on air: {action} {clip.path} at {player.seek_value(cursor)}s")
+            try:
+                if action == "seek":
+                    await player.seek(cursor)
+                elif action == "resume":
+                    await player.resume()
+                else:
+                    await self._switch(player, clip, cursor)
+            except VLCError as e:
+                logger.warning(f"Correction failed: {e}")
+                return
+        metrics.DRIFT_CORRECTIONS.inc(channel=self.name, action=action)
 
     async def start_scheduling(self, debug=False):
-        if self.config["vlc"]["start"]:
-            vlc_path = self.config["vlc"]["path"]["linux"]
+        vlc_config = self.config["vlc"]
+        ports = player_ports(vlc_config, bool(self.preroll_time))
+
+        if vlc_config["start"]:
+            vlc_path = vlc_config["path"]["linux"]
             if sys.platform.startswith('win'):
-                vlc_path = self.config["vlc"]["path"]["win"]
+                vlc_path = vlc_config["path"]["win"]
             if sys.platform == 'darwin':
-                vlc_path = self.config["vlc"]["path"]["darwin"]
-            self.vlc_launcher = VLCLauncher({
-                "host": self.config["vlc"]["host"],
-                "port": self.config["vlc"]["port"],
-                "extraintf": self.config["vlc"]["extraintf"],
-                "password": self.config["vlc"]["password"],
-                "path": vlc_path,
-                "options": self.config["vlc"]["options"]
-            }, debug=debug)
-            await self.vlc_launcher.launch()
-            # self.tasks.append(self.vlc_launcher.watch_exit())
-
-        self.vlc_client = VLCHTTPClient({
-            "host": self.config["vlc"]["host"],
-            "port": self.config["vlc"]["port"],
-            "password": self.config["vlc"]["password"]
-        })
-
-        self.vlc_client.loop(False)
-        self.vlc_client.repeat(False)
+                vlc_path = vlc_config["path"]["darwin"]
+            for port, rc_port in ports:
+                launcher = VLCLauncher({
+                    "host": vlc_config["host"],
+                    "port": port,
+                    "interface": vlc_config.get("interface", "http"),
+                    "rc_port": rc_port,
+                    "extraintf": vlc_config["extraintf"],
+                    "password": vlc_config["password"],
+                    "path": vlc_path,
+                    "options": vlc_config["options"],
+                    "start_paused": bool(self.preroll_time)
+                }, debug=debug)
+                await launcher.launch()
+                self.vlc_launchers.append(launcher)
+
+        for port, rc_port in ports:
+            self.players.append(create_vlc_client({
+                "host": vlc_config["host"],
+                "port": port,
+                "password": vlc_config["password"],
+                "interface": vlc_config.get("interface", "http"),
+                "rc_port": rc_port,
+                "rc_password": vlc_config.get("rc_password"),
+                "timeout": vlc_config.get("timeout", 2.0),
+                "retries": vlc_config.get("retries", 2),
+                "concurrency": vlc_config.get("concurrency", 4),
+                "subsecond_seek": vlc_config.get("subsecond_seek", False)
+            }))
+        self.vlc_client = self.players[0]
+
+        for player in self.players:
+            await player.loop(False)
+            await player.repeat(False)
 
         await self.load_schedule()
+        self.save_profile()
         self.tasks.append(self.task_schedule_clips())
-        self.tasks.append(self.vlc_launcher.watch_exit())
+        if not self.builder or self.initial_schedule is None:
+            self.builder_ready.set()
+        if self.max_drift:
+            self.tasks.append(self.task_supervise_clip_on_air())
+        if self.builder and self.builder.horizon:
+            self.tasks.append(self.task_extend_schedule())
+        if self.builder and self.config["scheduling"].get("watch"):
+            self.tasks.append(self.task_watch_schedule())
+        for launcher in self.vlc_launchers:
+            self.tasks.append(launcher.watch_exit())
 
         logger.info("Start scheduling")
         try:
             await asyncio.gather(*self.tasks)
         finally:
+            # extensions and reloads are reported at shutdown
+            self.save_profile()
+            for player in self.players:
+                await player.close()
             logger.info('Stop scheduling')
 
 
-async def main():
+async def main(builder: build.ScheduleBuilder | None = None, profile: set[str] | None = None):
     logger.info("Start")
-    vs = VideoScheduler()
+    vs = VideoScheduler(builder=builder, profiler=Profiler(profile) if profile else None)
     await vs.start_scheduling(debug=False)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(profile=profile_options()))
@@ -1,10 +1,12 @@
-from dataclasses import dataclass, field, asdict
+import operator
+from array import array
+from dataclasses import dataclass, field, fields
 from datetime import datetime, timedelta
 import typing
 
 import yaml
 
-from src.timeutils import fmod_delta
+from src.timeutils import fmod_delta, to_us, date_from_us, delta_from_us, NO_TIME
 
 
 def _next_index():
@@ -19,15 +21,15 @@ NEXT_INDEX = _next_index()
 
 @dataclass
 class ScheduleFile:
-    start_at: str | int | datetime = field(default_factory=datetime.now)
+    start_at: str | int | datetime = None  # the anchor of the build when not set
     end_at: str | int | datetime = None
     sources: [typing.Any] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class ScheduleClip:
     id: int = field(default_factory=NEXT_INDEX.__next__)
-    parent: typing.Any = None
+    source_id: int | None = None  # id of the ScheduleSource it comes from
     path: str = None
     priority: int = 100
     start_at: str | int | datetime = None
@@ -87,7 +89,11 @@ class ScheduleClip:
     #     self.cursor_end_at = fmod_delta(self.cursor_start_at + self.play_duration, self.duration)
 
     def clone(self):
-        return ScheduleClip(**asdict(self))
+        """Shallow copy, fields are immutable values"""
+        return ScheduleClip(*_schedule_clip_fields(self))
+
+
+_schedule_clip_fields = operator.attrgetter(*[f.name for f in fields(ScheduleClip)])
 
 
 def _yaml_schedule_clip_representation(dumper, data: ScheduleClip):
@@ -108,6 +114,78 @@ def _yaml_schedule_clip_representation(dumper, data: ScheduleClip):
 yaml.add_representer(ScheduleClip, _yaml_schedule_clip_representation)
 
 
+class ScheduleClipArray:
+    """
+    Array-backed list of clips: times as int64 microseconds and interned paths, about 70 bytes per clip.
+    Clips are created on access, thus it is for storing and moving large schedules, not for editing them.
+    """
+    _DATES = ("start_at", "end_at")
+    _DELTAS = ("duration", "play_duration", "cursor_start_at", "cursor_end_at")
+
+    def __init__(self, clips: typing.Iterable[ScheduleClip] = ()):
+        self.paths: [str] = []
+        self._path_indexes: {str: int} = {}
+        self.times: {str: array} = {k: array("q") for k in self._DATES + self._DELTAS}
+        self.source_ids = array("q")
+        self.priorities = array("i")
+        self.path_indexes = array("I")
+        self.loops = array("b")
+        self.extend(clips)
+
+    def append(self, c: ScheduleClip):
+        path_index = self._path_indexes.get(c.path)
+        if path_index is None:
+            path_index = self._path_indexes[c.path] = len(self.paths)
+            self.paths.append(c.path)
+        for k, column in self.times.items():
+            column.append(to_us(getattr(c, k)))
+        self.source_ids.append(NO_TIME if c.source_id is None else c.source_id)
+        self.priorities.append(c.priority)
+        self.path_indexes.append(path_index)
+        self.loops.append(c.loop)
+
+    def extend(self, clips: typing.Iterable[ScheduleClip]):
+        if not isinstance(clips, ScheduleClipArray):
+            for c in clips:
+                self.append(c)
+            return
+        # copy the columns, only paths need to be mapped
+        path_map = []
+        for p in clips.paths:
+            if p not in self._path_indexes:
+                self._path_indexes[p] = len(self.paths)
+                self.paths.append(p)
+            path_map.append(self._path_indexes[p])
+        for k, column in self.times.items():
+            column.extend(clips.times[k])
+        self.source_ids.extend(clips.source_ids)
+        self.priorities.extend(clips.priorities)
+        self.path_indexes.extend(array("I", (path_map[i] for i in clips.path_indexes)))
+        self.loops.extend(clips.loops)
+
+    def __len__(self):
+        return len(self.priorities)
+
+    def __getitem__(self, i: int) -> ScheduleClip:
+        source_id = self.source_ids[i]
+        return ScheduleClip(source_id=None if source_id == NO_TIME else source_id,
+                            path=self.paths[self.path_indexes[i]], priority=self.priorities[i],
+                            loop=bool(self.loops[i]),
+                            **{k: date_from_us(self.times[k][i]) for k in self._DATES},
+                            **{k: delta_from_us(self.times[k][i]) for k in self._DELTAS})
+
+    def __iter__(self) -> typing.Iterator[ScheduleClip]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __delitem__(self, i: int | slice):
+        for column in (*self.times.values(), self.source_ids, self.priorities, self.path_indexes, self.loops):
+            del column[i]
+
+    def end_at_us(self, i: int) -> int:
+        return self.times["end_at"][i]
+
+
 @dataclass
 class ScheduleSource:
     id: int = field(default_factory=NEXT_INDEX.__next__)
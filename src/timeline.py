@@ -0,0 +1,200 @@
+import bisect
+import heapq
+import logging
+import typing
+from datetime import datetime, timedelta
+
+from src.timeutils import fmod_delta
+from src.scheduler_types import ScheduleClip
+
+logger = logging.getLogger(__name__)
+
+# what happens to a clip interrupted by a higher priority one
+POLICY_STOP = "stop"  # drop the remaining part
+POLICY_RESTART = "restart"  # play it again from its first cursor when the interruption ends
+POLICY_CONTINUE = "continue"  # pause it and continue from the same cursor when the interruption ends
+POLICY_SKIP_TIME = "skip_time"  # keep it running underneath, show what remains when the interruption ends
+
+
+def interruption_policy(source) -> str:
+    if not source:
+        return POLICY_STOP
+    if source.clip_restart_after_interruption:
+        return POLICY_RESTART
+    if source.clip_continue_after_interruption:
+        return POLICY_CONTINUE
+    if source.clip_skip_time_after_interruption:
+        return POLICY_SKIP_TIME
+    return POLICY_STOP
+
+
+class _Layer:
+    """Sweep state of a clip that started and has not ended yet"""
+    __slots__ = ("clip", "policy", "key", "played", "deadline", "dropped")
+
+    def __init__(self, clip: ScheduleClip, seq: int, source):
+        self.clip = clip
+        self.policy = interruption_policy(source)
+        # higher priority first, then the clip that arrived first
+        self.key = (clip.priority, seq)
+        self.played = timedelta(0)
+        self.dropped = False
+        self.deadline = clip.end_at
+        if self.deferred:
+            # paused clips can't outlive their source
+            self.deadline = getattr(source, "end_at", None) or datetime.max
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+    @property
+    def deferred(self):
+        return self.policy in (POLICY_RESTART, POLICY_CONTINUE)
+
+    def end_at(self, since: datetime) -> datetime:
+        """When the clip ends if it stays on air from since"""
+        if self.deferred:
+            return min(since + (self.clip.end_at - self.clip.start_at) - self.played, self.deadline)
+        return self.clip.end_at
+
+    def is_alive(self, t: datetime) -> bool:
+        return not self.dropped and self.deadline > t
+
+
+def _fragment(layer: _Layer, start_at: datetime, end_at: datetime) -> ScheduleClip | None:
+    clip = layer.clip
+    if start_at >= end_at:
+        return None
+    if layer.policy == POLICY_SKIP_TIME:
+        offset = start_at - clip.start_at
+    else:
+        offset = layer.played
+    if start_at == clip.start_at and end_at == clip.end_at and not offset:
+        return clip
+
+    f = clip.clone()
+    f.start_at = start_at
+    f.end_at = end_at
+    f.play_duration = end_at - start_at
+    f.cursor_start_at = fmod_delta(clip.cursor_start_at + offset, clip.duration)
+    f.cursor_end_at = fmod_delta(f.cursor_start_at + f.play_duration, clip.duration)
+    return f
+
+
+def resolve_timeline(clips: typing.Iterable[ScheduleClip],
+                     until: datetime | None = None,
+                     sources: dict[int, typing.Any] | None = None) -> typing.Iterator[ScheduleClip]:
+    """
+    Resolve priority conflicts of clips with a sweep line over their start and end times.
+
+    Clips must be ordered by start time (then priority), the result is the sequence of
+    non-overlapping clips to put on air, ordered by start time.
+    Interrupted clips are split, cropped or resumed according to the interruption policy of their source,
+    looked up by id in sources.
+    Each clip is pushed and popped once from a heap of active layers, thus it runs in O(n log n).
+
+    If until is given, clips must include all clips starting before until and the sweep stops there:
+    the clip on air at until is emitted up to its natural end, as it is not known what comes after.
+    """
+    clips = iter(clips)
+    pending: ScheduleClip | None = next(clips, None)
+    active: [_Layer] = []
+    on_air: _Layer | None = None
+    since: datetime | None = None
+    seq = 0
+    sources = sources or {}
+
+    while pending or active:
+        on_air_end_at = on_air.end_at(since) if on_air else None
+        if pending and (not on_air or pending.start_at < on_air_end_at):
+            t = pending.start_at
+        else:
+            t = on_air_end_at
+
+        if until and t >= until:
+            f = _fragment(on_air, since, on_air_end_at) if on_air else None
+            if f:
+                yield f
+            return
+
+        # the clip on air ends
+        if on_air and on_air_end_at <= t:
+            f = _fragment(on_air, since, on_air_end_at)
+            if f:
+                yield f
+            heapq.heappop(active)
+            on_air = None
+
+        # clips starting now
+        while pending and pending.start_at <= t:
+            heapq.heappush(active, _Layer(pending, seq, sources.get(pending.source_id)))
+            seq += 1
+            pending = next(clips, None)
+
+        while active and not active[0].is_alive(t):
+            heapq.heappop(active)
+        top = active[0] if active else None
+
+        if top is on_air:
+            continue
+
+        if on_air:
+            # interrupted by a higher priority clip
+            logger.debug(f"Interrupt clip {on_air.clip.path} at {t} by {top.clip.path}, {on_air.policy}")
+            f = _fragment(on_air, since, t)
+            if f:
+                yield f
+            on_air.played += t - since
+            if on_air.policy == POLICY_STOP:
+                on_air.dropped = True
+            elif on_air.policy == POLICY_RESTART:
+                on_air.played = timedelta(0)
+
+        on_air = top
+        since = t
+
+
+def clip_cursor_at(clip: ScheduleClip, t: datetime) -> timedelta:
+    """Position in the media of a clip on air at t, looped clips wrap around their duration"""
+    cursor = clip.cursor_start_at + (t - clip.start_at)
+    if clip.loop:
+        return fmod_delta(cursor, clip.duration)
+    return cursor
+
+
+class TimelineIndex:
+    """
+    Time queries over a resolved schedule: non-overlapping clips ordered by start time, as given by
+    resolve_timeline. Start and end times are kept in sorted arrays, queries bisect them in O(log n).
+    """
+
+    def __init__(self, clips: typing.Iterable[ScheduleClip]):
+        self.clips: [ScheduleClip] = list(clips)
+        self.starts: [datetime] = [c.start_at for c in self.clips]
+        self.ends: [datetime] = [c.end_at for c in self.clips]
+
+    def __len__(self):
+        return len(self.clips)
+
+    def __getitem__(self, i: int) -> ScheduleClip:
+        return self.clips[i]
+
+    def index_at(self, t: datetime) -> int:
+        """Index of the first clip not ended at t, i.e. on air at t or the next one, len(self) if none"""
+        return bisect.bisect_right(self.ends, t)
+
+    def clip_at(self, t: datetime) -> ScheduleClip | None:
+        """The clip on air at t"""
+        i = bisect.bisect_right(self.starts, t) - 1
+        if i >= 0 and self.ends[i] > t:
+            return self.clips[i]
+        return None
+
+    def next_after(self, t: datetime) -> ScheduleClip | None:
+        """The first clip starting after t"""
+        i = bisect.bisect_right(self.starts, t)
+        return self.clips[i] if i < len(self.clips) else None
+
+    def window(self, start_at: datetime, end_at: datetime) -> [ScheduleClip]:
+        """Clips on air between start_at and end_at"""
+        return self.clips[self.index_at(start_at):bisect.bisect_left(self.starts, end_at)]
@@ -1,11 +1,14 @@
 import math
 import re
+import struct
 from datetime import datetime, timedelta
 import pytimeparse
 
 re_hms_format = re.compile(r'^\s*(\d+[Hh])?\s*(\d+[Mm])?\s*(\d+[Ss])?$')
 re_hms_format2 = re.compile(f'^(?P<hours>\d+):(?P<minutes>\d+):(?P<seconds>[\d.]+)$')
 
+IMAGE_DURATION = timedelta(seconds=10)  # default of scheduling.imageDuration, still images have no duration
+
 
 def to_date(data, start_date=datetime.now(), default=None):
     assert start_date
@@ -53,7 +56,27 @@ def to_delta(data, start_date=datetime.now(), default=timedelta(seconds=0)):
     raise NotImplementedError(data)
 
 
-def video_duration(path):
+def is_absolute_time(data) -> bool:
+    """The time is a date, not relative to a start date, see to_date"""
+    if isinstance(data, datetime):
+        return True
+    if isinstance(data, str):
+        return not re_hms_format.match(data) and not re_hms_format2.match(data)
+    return False
+
+
+def video_duration(path, image_duration=IMAGE_DURATION):
+    from src.mediaprobe import is_image, probe_duration
+    if is_image(path):
+        return to_delta(image_duration, default=IMAGE_DURATION)
+    try:
+        seconds = probe_duration(path)
+    except (OSError, struct.error, IndexError):
+        seconds = None
+    if seconds is not None:
+        return timedelta(seconds=seconds)
+
+    # unknown container, fallback to moviepy
     from moviepy.editor import VideoFileClip
     clip = VideoFileClip(path)
     result = timedelta(seconds=clip.duration)
@@ -71,3 +94,26 @@ def fmod_delta(a: timedelta, b: timedelta):
     return timedelta(
         seconds=math.fmod(a.total_seconds(), (b + timedelta(microseconds=1)).total_seconds())
     )
+
+
+# compact times, as int64 microseconds
+# datetimes are counted from 1970-01-01 in naive local time, like the rest of the schedule
+NO_TIME = -2 ** 63  # None
+EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+
+def to_us(value: datetime | timedelta | None) -> int:
+    if value is None:
+        return NO_TIME
+    if isinstance(value, datetime):
+        return (value - EPOCH) // _US
+    return value // _US
+
+
+def date_from_us(us: int) -> datetime | None:
+    return None if us == NO_TIME else EPOCH + timedelta(microseconds=us)
+
+
+def delta_from_us(us: int) -> timedelta | None:
+    return None if us == NO_TIME else timedelta(microseconds=us)
@@ -1,7 +1,14 @@
+import base64
+import json
 import logging, time, asyncio
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass
+from urllib.parse import quote, urlparse
+from urllib.request import url2pathname
 
-import requests
-from urllib.parse import urljoin
+from src import metrics
 
 
 class VLCError(Exception):
@@ -23,16 +30,21 @@ class VLCLauncher:
         self.base_url = 'http://' + config['host'] + ':' + str(config['port'])
         self.process = None
 
-    def check_connection(self, retries=0):
+    async def check_connection(self, retries=0):
         for i in range(retries, -1, -1):
             try:
-                resp = requests.get(self.base_url, timeout=5)
-            except requests.exceptions.RequestException as e:
+                if self.config.get('interface') == 'rc':
+                    _, writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.config['host'], self.config['rc_port']), timeout=5)
+                    writer.close()
+                    return True
+                resp = await asyncio.wait_for(_http_get(self.config['host'], self.config['port'], '/'), timeout=5)
+            except (OSError, asyncio.TimeoutError) as e:
                 if i > 0:
                     logging.warning(
                         'Connection attempt failed because of: %s. Retry in 3 seconds.' % str(e)
                     )
-                    time.sleep(3)
+                    await asyncio.sleep(3)
                     continue
             else:
                 if 'VideoLAN' in resp.text:
@@ -42,7 +54,7 @@ class VLCLauncher:
 
     async def launch(self):
         try:
-            self.check_connection()
+            await self.check_connection()
         except VLCConnectionError:
             pass
         else:
@@ -60,6 +72,11 @@ class VLCLauncher:
                       '--repeat', '--image-duration', '-1'
                   ] + self.config['options']
 
+        if self.config.get('interface') == 'rc':
+            command.extend(('--rc-host', '%s:%s' % (self.config['host'], self.config['rc_port'])))
+        if self.config.get('start_paused'):
+            command.append('--start-paused')
+
         kwargs = {}
 
         if self.debug:
@@ -69,8 +86,8 @@ class VLCLauncher:
             kwargs['stdout'] = asyncio.subprocess.DEVNULL
 
         self.process = await asyncio.create_subprocess_exec(*command, **kwargs)
-        time.sleep(1)
-        self.check_connection(3)
+        await asyncio.sleep(1)
+        await self.check_connection(3)
         return self.process
 
     async def watch_exit(self):
@@ -81,93 +98,439 @@ class VLCLauncher:
         raise VLCExitError('VLC was closed.')
 
 
-class VLCHTTPClient:
-    def __init__(self, config, ping_urls=None):
-        self.session = requests.session()
-        self.base_url = 'http://' + config['host'] + ':' + str(config['port'])
-        self.session.auth = ('', config['password'])
-        self.ping_urls = ping_urls
-
-    def _request(self, path, **kwargs):
-        resp = self.session.get(urljoin(self.base_url, path), **kwargs)
-
-        if resp.status_code != requests.codes.ok:
-            resp.raise_for_status()
-
-        self.session.close()  # VLC doesn't support keep-alive
-
+class VLCResponse:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+async def _http_get(host, port, path, password=None):
+    # VLC doesn't support keep-alive, a HTTP/1.0 request is answered and closed
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        headers = ['GET %s HTTP/1.0' % path, 'Host: %s:%s' % (host, port)]
+        if password is not None:
+            token = base64.b64encode((':' + str(password)).encode()).decode()
+            headers.append('Authorization: Basic ' + token)
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode())
+        await writer.drain()
+        data = await reader.read()
+    finally:
+        writer.close()
+
+    head, _, content = data.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status_code = int(lines[0].split()[1]) if lines and len(lines[0].split()) > 1 else 0
+    headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+    return VLCResponse(status_code, headers, content)
+
+
+@dataclass
+class PlayerState:
+    """Last known player state, None when unknown"""
+    state: str | None = None
+    repeat: bool | None = None
+    loop: bool | None = None
+    current_id: int | None = None
+    time: int | None = None
+    length: int | None = None
+
+    def update(self, status: dict):
+        self.state = status.get('state', self.state)
+        self.repeat = status.get('repeat', self.repeat)
+        self.loop = status.get('loop', self.loop)
+        self.time = status.get('time', self.time)
+        self.length = status.get('length', self.length)
+        if status.get('currentplid', -1) != -1:
+            self.current_id = status['currentplid']
+
+
+def playlist_key(path_or_uri: str) -> str:
+    """Compare paths of the schedule with playlist uris as absolute paths"""
+    if '://' in path_or_uri:
+        uri = urlparse(path_or_uri)
+        if uri.scheme != 'file':
+            return path_or_uri
+        return os.path.normpath(url2pathname(uri.path))
+    return os.path.abspath(path_or_uri)
+
+
+class AsyncVLCClient:
+    """
+    Base of the asyncio VLC control clients, it never blocks the event loop.
+    Every request has a timeout, requests are bounded in concurrency and retried with exponential backoff.
+    """
+    # commands flipping a player setting -> the PlayerState field they flip. They are never retried:
+    # VLC may have applied a request whose answer came late, the setting is read again instead.
+    TOGGLES = {'pl_repeat': 'repeat', 'pl_loop': 'loop', 'pl_pause': 'state', 'pause': 'state'}
+
+    def __init__(self, config):
+        self.host = config['host']
+        self.timeout = config.get('timeout', 2.0)
+        self.retries = config.get('retries', 2)
+        self.backoff = config.get('backoff', 0.1)
+        self._semaphore = asyncio.Semaphore(config.get('concurrency', 4))
+        self.state = PlayerState()
+        self.round_trips = 0
+        self.playlist_ids: {str: int} = {}  # path -> VLC playlist id
+        # VLC versions accepting decimal seconds seek to the millisecond, others to the whole second
+        self.subsecond_seek = config.get('subsecond_seek', False)
+
+    async def _call(self, command, fn, *args):
+        delay = self.backoff
+        toggled = self.TOGGLES.get(command)
+        for i in range(0 if toggled else self.retries, -1, -1):
+            try:
+                async with self._semaphore:
+                    self.round_trips += 1
+                    t0 = time.perf_counter()
+                    result = await asyncio.wait_for(fn(*args), timeout=self.timeout)
+                    metrics.VLC_REQUEST_SECONDS.observe(time.perf_counter() - t0, command=command)
+                    return result
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                metrics.VLC_REQUEST_ERRORS.inc(command=command)
+                if i == 0:
+                    if toggled:
+                        setattr(self.state, toggled, None)
+                    raise VLCConnectionError('VLC request failed: %s' % (str(e) or type(e).__name__))
+                logging.warning('VLC request failed because of: %s. Retry in %.2f seconds.' % (str(e), delay))
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def close(self):
+        pass
+
+    async def switch(self, uid, cursor=0, repeat=False):
+        """
+        Play a playlist item from cursor (seconds), with the minimum sequence of commands
+        given the known player state. Return the number of round-trips.
+        """
+        round_trips = self.round_trips
+        await self.play(uid)
+        cursor = self.seek_value(cursor)
+        # a just started item is at its beginning, no need to seek there
+        if cursor >= 0.1:
+            await self.seek(cursor)
+        await self.repeat(repeat)
+        return self.round_trips - round_trips
+
+    def seek_value(self, cursor):
+        return round(cursor, 3) if self.subsecond_seek else round(cursor)
+
+    async def playlist_items(self) -> [(int, str | None, str)]:
+        """(id, path or None if unknown, name) of the playlist items, in playlist order"""
+        raise NotImplementedError
+
+    async def sync_playlist(self, paths: [str], known_ids: dict[str, int] | None = None) -> int:
+        """
+        Map paths to playlist ids, from the items already in the playlist, and enqueue the missing ones.
+        known_ids (e.g. saved by a previous run) is trusted for items listed without their path, when names match.
+        Return the number of enqueued paths.
+        """
+        items = await self.playlist_items()
+        listed = {}
+        names = {}
+        for uid, path, name in items:
+            if path:
+                listed.setdefault(playlist_key(path), uid)
+            names[uid] = name
+        for path, uid in (known_ids or {}).items():
+            if names.get(uid) == os.path.basename(path):
+                listed.setdefault(playlist_key(path), uid)
+
+        missing = [p for p in dict.fromkeys(paths) if playlist_key(p) not in listed]
+        if missing:
+            logging.info('Enqueue %d of %d paths in VLC playlist' % (len(missing), len(set(paths))))
+            if all(path for _, path, _ in items):
+                # items are found back by path, enqueue concurrently
+                await asyncio.gather(*[self.enqueue(p) for p in missing])
+                for uid, path, _ in await self.playlist_items():
+                    if path:
+                        listed.setdefault(playlist_key(path), uid)
+            else:
+                # items are found back by position, enqueue in order, they are the last ones
+                for p in missing:
+                    await self.enqueue(p)
+                added = (await self.playlist_items())[len(items):]
+                if len(added) == len(missing):
+                    for p, (uid, _, _) in zip(missing, added):
+                        listed[playlist_key(p)] = uid
+
+        for p in paths:
+            uid = listed.get(playlist_key(p))
+            if uid is None:
+                raise VLCError('Path %s is missing from VLC playlist' % p)
+            self.playlist_ids[p] = uid
+        return len(missing)
+
+
+class AsyncVLCHTTPClient(AsyncVLCClient):
+    """Control VLC through its HTTP interface"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.port = config['port']
+        self.password = config['password']
+
+    async def _request(self, path, params=None, command=None):
+        if params:
+            # only escape what can't be sent in a request line, VLC doesn't decode urlencoded parameters
+            path = path + '?' + quote(params, safe="/?&=:%,;@!$'()*~")
+        command = command or path.rsplit('/', 1)[-1].split('.')[0]
+        resp = await self._call(command, _http_get, self.host, self.port, '/' + path, self.password)
+        if resp.status_code != 200:
+            raise VLCError('VLC request %s failed with status %s' % (path, resp.status_code))
         return resp
 
-    def _command(self, command, params={}):
+    async def _command(self, command, params={}):
         # VLC doesn't support urlencoded parameters
         # https://forum.videolan.org/viewtopic.php?f=16&t=145695
         params = ('command=' + command + '&' +
                   '&'.join('%s=%s' % (k, v) for k, v in params.items()))
 
-        return self._request('requests/status.xml', params=params)
-
-    def _playlist(self):
-        return self._request('requests/playlist.xml')
+        # status.json answers commands with the updated status, keep track of it
+        resp = await self._request('requests/status.json', params=params, command=command)
+        try:
+            self.state.update(resp.json())
+        except ValueError:
+            pass
+        return resp
 
     def _format_uri(self, uri):
         # VLC only understands urlencoded =
         return uri.replace('=', '%3D')
 
-    def status(self):
-        return self._request('requests/status.json').json()
+    async def status(self):
+        status = (await self._request('requests/status.json')).json()
+        self.state.update(status)
+        return status
+
+    async def playlist(self):
+        return (await self._request('requests/playlist.xml')).content
+
+    async def playlist_items(self):
+        root = ElementTree.fromstring(await self.playlist())
+        # the first node is the playlist, the second one the media library
+        node = root.find('node')
+        if node is None:
+            node = root
+        return [(int(x.get('id')), x.get('uri'), x.get('name')) for x in node.iter('leaf')]
 
-    def add(self, uri):
-        return self._command('in_play', {'input': self._format_uri(uri)})
+    async def add(self, uri):
+        return await self._command('in_play', {'input': self._format_uri(uri)})
 
-    def enqueue(self, uri):
-        return self._command('in_enqueue', {'input': self._format_uri(uri)})
+    async def enqueue(self, uri):
+        return await self._command('in_enqueue', {'input': self._format_uri(uri)})
 
-    def play(self, uid=None):
-        # try:
+    async def play(self, uid=None):
         if uid:
-            return self._command('pl_play', {'id': uid})
-        else:
-            return self._command('pl_play')
-        # finally:
-        #     if seek is not None:
-        #         self.pause()
-        #         self.seek(seek)
-        #         self.pause()
+            resp = await self._command('pl_play', {'id': uid})
+            # VLC answers before the input is opened, the status may still show the previous item
+            self.state.current_id = int(uid)
+            self.state.state = 'playing'
+            return resp
+        return await self._command('pl_play')
 
-    def pause(self):
-        return self._command('pl_pause')
+    async def pause(self):
+        return await self._command('pl_pause')
 
-    def stop(self):
-        return self._command('pl_stop')
+    async def resume(self):
+        return await self._command('pl_forceresume')
 
-    def next(self):
-        return self._command('pl_next')
+    async def force_pause(self):
+        return await self._command('pl_forcepause')
 
-    def previous(self):
-        return self._command('pl_previous')
+    async def stop(self):
+        return await self._command('pl_stop')
 
-    def empty(self):
-        return self._command('pl_empty')
+    async def next(self):
+        return await self._command('pl_next')
 
-    def toggle_repeat(self):
-        return self._command('pl_repeat')
+    async def previous(self):
+        return await self._command('pl_previous')
 
-    def repeat(self, value=None):
-        if value is None:
-            return self._command('pl_repeat')
+    async def empty(self):
+        return await self._command('pl_empty')
 
-        if self.status()['repeat'] != value:
-            return self._command('pl_repeat')
+    async def toggle_repeat(self):
+        return await self._command('pl_repeat')
 
-    def loop(self, value=True):
-        if self.status()['loop'] != value:
-            return self._command('pl_repeat')
+    async def repeat(self, value=None):
+        if value is not None and self.state.repeat is None:
+            await self.status()
+        if value is None or self.state.repeat != value:
+            return await self._command('pl_repeat')
 
-    def seek(self, cursor=0):
-        return self._command('seek', params={
-            "val": cursor
+    async def loop(self, value=True):
+        if self.state.loop is None:
+            await self.status()
+        if self.state.loop != value:
+            return await self._command('pl_loop')
+
+    async def seek(self, cursor=0):
+        return await self._command('seek', params={
+            "val": self.seek_value(cursor)
         })
 
-    # def playlist(self):
-    #     import xmltodict
-    #     return xmltodict.parse(self._playlist().content)
+
+class AsyncVLCRCClient(AsyncVLCClient):
+    """
+    Control VLC through its Lua RC (or telnet) interface.
+    The connection is kept open, commands are serialized on it.
+    """
+
+    PROMPT = b'> '
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.port = config['rc_port']
+        self.password = config.get('rc_password')
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+        # the rc seek command takes whole seconds
+        self.subsecond_seek = False
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        greeting = await self._read_until_prompt(password_prompt=True)
+        if b'Password:' in greeting:
+            self._writer.write((str(self.password) + '\n').encode())
+            await self._writer.drain()
+            await self._read_until_prompt()
+
+    async def _read_until_prompt(self, password_prompt=False):
+        data = b''
+        while not data.endswith(self.PROMPT):
+            chunk = await self._reader.read(4096)
+            if not chunk:
+                raise asyncio.IncompleteReadError(data, None)
+            data += chunk
+            if password_prompt and data.rstrip().endswith(b'Password:'):
+                break
+        return data
+
+    async def _send(self, line):
+        async with self._lock:
+            try:
+                if not self._writer:
+                    await self._connect()
+                self._writer.write((line + '\n').encode())
+                await self._writer.drain()
+                data = await self._read_until_prompt()
+            except BaseException:
+                # the connection state is unknown, reconnect at the next command
+                await self.close()
+                raise
+        return data[:-len(self.PROMPT)].decode('utf-8', errors='replace').strip()
+
+    async def _command(self, command, *args):
+        return await self._call(command, self._send, ' '.join([command] + [str(x) for x in args]))
+
+    async def close(self):
+        if self._writer:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def status(self):
+        state = await self._command('status')
+        m = re.search(r'state (\w+)', state)
+        time_ = await self._command('get_time')
+        length = await self._command('get_length')
+        status = {
+            'state': m.group(1) if m else 'stopped',
+            'time': int(time_) if time_.isdigit() else 0,
+            'length': int(length) if length.isdigit() else 0,
+            'repeat': bool(self.state.repeat),
+            'loop': bool(self.state.loop)
+        }
+        self.state.update(status)
+        return status
+
+    async def playlist(self):
+        return await self._command('playlist')
+
+    async def playlist_items(self):
+        # the rc interface lists names, not paths, e.g. "|   4 - clip.mp4 (00:00:20) [played 1 time]"
+        items = []
+        for m in re.finditer(r'^\|\s*\*?(\d+) - (.*?)(?: \(\d+:\d\d:\d\d\))?(?: \[played \d+ times?\])?$',
+                             await self.playlist(), re.M):
+            uid = int(m.group(1))
+            # 1 and 2 are the playlist and media library nodes
+            if uid > 2:
+                items.append((uid, None, m.group(2)))
+        return items
+
+    async def add(self, uri):
+        return await self._command('add', uri)
+
+    async def enqueue(self, uri):
+        return await self._command('enqueue', uri)
+
+    async def play(self, uid=None):
+        self.state.state = 'playing'
+        if uid:
+            self.state.current_id = int(uid)
+            return await self._command('goto', uid)
+        return await self._command('play')
+
+    async def pause(self):
+        self.state.state = 'paused' if self.state.state == 'playing' else 'playing'
+        return await self._command('pause')
+
+    async def resume(self):
+        self.state.state = 'playing'
+        return await self._command('play')
+
+    async def force_pause(self):
+        if self.state.state is None:
+            await self.status()
+        if self.state.state != 'paused':
+            return await self.pause()
+
+    async def stop(self):
+        self.state.state = 'stopped'
+        return await self._command('stop')
+
+    async def next(self):
+        return await self._command('next')
+
+    async def previous(self):
+        return await self._command('prev')
+
+    async def empty(self):
+        return await self._command('clear')
+
+    async def toggle_repeat(self):
+        return await self.repeat(not self.state.repeat)
+
+    async def repeat(self, value=None):
+        if value is None:
+            value = not self.state.repeat
+        if self.state.repeat == bool(value):
+            return
+        self.state.repeat = bool(value)
+        return await self._command('repeat', 'on' if value else 'off')
+
+    async def loop(self, value=True):
+        if self.state.loop == bool(value):
+            return
+        self.state.loop = bool(value)
+        return await self._command('loop', 'on' if value else 'off')
+
+    async def seek(self, cursor=0):
+        return await self._command('seek', self.seek_value(cursor))
+
+
+def create_vlc_client(config) -> AsyncVLCClient:
+    if config.get('interface') == 'rc':
+        return AsyncVLCRCClient(config)
+    return AsyncVLCHTTPClient(config)
@@ -0,0 +1,117 @@
+import asyncio
+import ctypes
+import ctypes.util
+import glob
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+def _glob_base_dir(pattern: str) -> str:
+    """The longest directory prefix of the pattern without glob magic"""
+    parts = []
+    for part in os.path.normpath(os.path.dirname(pattern)).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or "."
+
+
+class _Inotify:
+    def __init__(self, directories: [str]):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        for d in directories:
+            if libc.inotify_add_watch(self.fd, os.fsencode(d), WATCH_MASK) < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {d}")
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ScheduleWatcher:
+    """
+    Watch the files matching a glob pattern and report which ones changed.
+    It uses inotify when available, polling otherwise.
+    """
+
+    def __init__(self, pattern: str, polling_time: float = 2.0, debounce_time: float = 0.5):
+        self.pattern = pattern
+        self.polling_time = polling_time
+        self.debounce_time = debounce_time
+        self.files = self.snapshot()
+
+    def snapshot(self) -> {str: (int, int)}:
+        files = {}
+        for path in glob.glob(self.pattern):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                files[path] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    def diff(self) -> ({str}, {str}):
+        """Return changed (or added) and removed files since the last call"""
+        files = self.snapshot()
+        changed = {k for k, v in files.items() if self.files.get(k) != v}
+        removed = set(self.files) - set(files)
+        self.files = files
+        return changed, removed
+
+    async def changes(self):
+        """Yield (changed, removed) sets of paths, forever"""
+        wakeup = asyncio.Event()
+        inotify = None
+        loop = asyncio.get_running_loop()
+        try:
+            inotify = _Inotify([_glob_base_dir(self.pattern)])
+            loop.add_reader(inotify.fd, wakeup.set)
+            logger.info(f"Watch {self.pattern} with inotify")
+        except (OSError, AttributeError, NotImplementedError) as e:
+            inotify = None
+            logger.info(f"Watch {self.pattern} with polling every {self.polling_time}s ({e})")
+
+        try:
+            while True:
+                if inotify:
+                    await wakeup.wait()
+                    # editors write files in many steps, wait for them to settle
+                    await asyncio.sleep(self.debounce_time)
+                    wakeup.clear()
+                    inotify.drain()
+                else:
+                    await asyncio.sleep(self.polling_time)
+                changed, removed = self.diff()
+                if changed or removed:
+                    yield changed, removed
+        finally:
+            if inotify:
+                loop.remove_reader(inotify.fd)
+                inotify.close()
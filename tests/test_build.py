@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import yaml
+
+from src.build import ScheduleBuilder
+from src.mediacache import DurationCache
+
+
+def stub_duration(path: str) -> timedelta:
+    return timedelta(seconds=10 + len(path) % 7)
+
+
+def clip_key(c):
+    return c.path, c.start_at, c.end_at, c.cursor_start_at, c.cursor_end_at, c.priority, c.loop
+
+
+def make_builder(tmp_path, anchor: datetime) -> ScheduleBuilder:
+    media = tmp_path / "media"
+    media.mkdir()
+    for i in range(3):
+        (media / f"clip{i}.mp4").write_bytes(b"")
+    schedules = tmp_path / "scheduling"
+    schedules.mkdir()
+    (schedules / "a.yaml").write_text(yaml.safe_dump({"sources": [
+        {"source": str(media / "*.mp4"), "loop": True, "end_at": "1h", "priority": 10},
+        {"source": str(media / "clip1.mp4"), "start_at": "3s", "clip_play_duration": "5s",
+         "clip_repeat_interval": "1m", "loop": True, "end_at": "30m", "priority": 50},
+    ]}))
+    (schedules / "b.yaml").write_text(yaml.safe_dump({"sources": [
+        {"source": str(media / "clip0.mp4"), "start_at": "10m", "priority": 100},
+    ]}))
+    config = {"scheduling": {"path": str(schedules / "*.yaml"), "outDir": str(tmp_path / "build"),
+                             "buildWorkers": 1, "probeWorkers": 2, "outPriorityLevel": 1000}}
+    sb = ScheduleBuilder(config, durations=DurationCache(None, probe=stub_duration), anchor=anchor)
+    return sb
+
+
+def test_reload_unchanged_files_keeps_clips(tmp_path):
+    # built a while ago, a reload must not move relative times to the reload time
+    sb = make_builder(tmp_path, datetime.now() - timedelta(seconds=2))
+    asyncio.run(sb.process_schedule())
+    before = [clip_key(c) for c in sb.schedule]
+    assert before
+
+    paths = {str(tmp_path / "scheduling" / "a.yaml"), str(tmp_path / "scheduling" / "b.yaml")}
+    asyncio.run(sb.reload_schedule_files(paths, set()))
+    assert [clip_key(c) for c in sb.schedule] == before
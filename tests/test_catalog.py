@@ -0,0 +1,60 @@
+import glob
+import os
+
+import pytest
+
+from src.catalog import MediaCatalog
+
+PATTERNS = [
+    "videos/*.mp4",
+    "videos/*",
+    "videos/.*",
+    "videos/a.mp4",
+    "videos/missing.mp4",
+    "videos/*/*.mkv",
+    "videos/**/*.mkv",
+    "videos/[ab].mp4",
+    "videos/?.mp4",
+    "*/sub*/*",
+    "videos/sub1",
+    "videos/sub*",
+    "nowhere/*.mp4",
+]
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    for path in ["videos/a.mp4", "videos/b.mp4", "videos/c.jpg", "videos/.hidden.mp4", "videos/sub1/x.mkv",
+                 "videos/sub1/y.mp4", "videos/sub2/z.mkv", "videos/.sub3/w.mkv", "images/sub1/i.png"]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_bytes(b"")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def glob_files(pattern: str) -> [str]:
+    return sorted(x for x in glob.glob(pattern) if os.path.isfile(x))
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_glob_like_glob_glob(media, pattern):
+    assert MediaCatalog().glob(pattern) == glob_files(pattern)
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_absolute_glob_like_glob_glob(media, pattern):
+    pattern = os.path.join(str(media), pattern)
+    assert MediaCatalog().glob(pattern) == glob_files(pattern)
+
+
+def test_refresh_sees_changed_directories(media):
+    catalog = MediaCatalog()
+    assert catalog.glob("videos/*.mp4") == glob_files("videos/*.mp4")
+    (media / "videos" / "d.mp4").write_bytes(b"")
+    (media / "videos" / "a.mp4").unlink()
+    # directory mtimes may have a coarse resolution
+    os.utime(media / "videos", ns=(0, 0))
+
+    assert catalog.refresh() == 1
+    assert catalog.glob("videos/*.mp4") == glob_files("videos/*.mp4")
+    assert catalog.refresh() == 0
@@ -0,0 +1,90 @@
+import struct
+from datetime import timedelta
+
+import pytest
+
+from src.mediaprobe import probe_duration
+from src.timeutils import video_duration, IMAGE_DURATION
+
+
+def mp4_box(box_type: bytes, payload: bytes, large=False) -> bytes:
+    if large:
+        return struct.pack(">I4sQ", 1, box_type, 16 + len(payload)) + payload
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mvhd(timescale: int, duration: int, version=0) -> bytes:
+    if version == 1:
+        times = struct.pack(">QQIQ", 0, 0, timescale, duration)
+    else:
+        times = struct.pack(">IIII", 0, 0, timescale, duration)
+    # rate, volume, matrix... are not read
+    return mp4_box(b"mvhd", bytes([version, 0, 0, 0]) + times + bytes(80))
+
+
+def ebml_element(element_id: int, payload: bytes, unknown_size=False) -> bytes:
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    if unknown_size:
+        return id_bytes + b"\x01" + b"\xff" * 7 + payload
+    assert len(payload) < 127
+    return id_bytes + bytes([0x80 | len(payload)]) + payload
+
+
+def matroska(info: bytes, before_info: bytes = b"") -> bytes:
+    header = ebml_element(0x1A45DFA3, ebml_element(0x4282, b"matroska"))
+    return header + ebml_element(0x18538067, before_info + ebml_element(0x1549A966, info), unknown_size=True)
+
+
+def write(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_mp4(tmp_path):
+    data = mp4_box(b"ftyp", b"isom\0\0\0\0") + mp4_box(b"moov", mvhd(1000, 12345))
+    assert probe_duration(write(tmp_path, "a.mp4", data)) == pytest.approx(12.345)
+
+
+def test_mp4_64_bit_boxes_before_moov(tmp_path):
+    data = (mp4_box(b"ftyp", b"isom\0\0\0\0") + mp4_box(b"mdat", bytes(100), large=True)
+            + mp4_box(b"moov", mp4_box(b"udta", b"") + mvhd(90000, 90000 * 3600 * 30, version=1)))
+    assert probe_duration(write(tmp_path, "a.mov", data)) == pytest.approx(3600 * 30)
+
+
+def test_mp4_unknown_duration(tmp_path):
+    data = mp4_box(b"ftyp", b"isom\0\0\0\0") + mp4_box(b"moov", mvhd(1000, 0xFFFFFFFF))
+    assert probe_duration(write(tmp_path, "a.mp4", data)) is None
+
+
+def test_mp4_without_moov(tmp_path):
+    data = mp4_box(b"ftyp", b"isom\0\0\0\0") + mp4_box(b"mdat", bytes(100))
+    assert probe_duration(write(tmp_path, "a.mp4", data)) is None
+
+
+def test_matroska(tmp_path):
+    info = ebml_element(0x2AD7B1, (1_000_000).to_bytes(3, "big")) + ebml_element(0x4489, struct.pack(">d", 5432.5))
+    # elements before Info, e.g. SeekHead and Void, are skipped
+    data = matroska(info, ebml_element(0x114D9B74, bytes(20)) + ebml_element(0xEC, bytes(10)))
+    assert probe_duration(write(tmp_path, "a.mkv", data)) == pytest.approx(5.4325)
+
+
+def test_matroska_float_duration_and_default_scale(tmp_path):
+    data = matroska(ebml_element(0x4489, struct.pack(">f", 1500.0)))
+    assert probe_duration(write(tmp_path, "a.webm", data)) == pytest.approx(1.5)
+
+
+def test_matroska_without_duration(tmp_path):
+    data = matroska(ebml_element(0x2AD7B1, (1_000_000).to_bytes(3, "big")))
+    assert probe_duration(write(tmp_path, "a.mkv", data)) is None
+
+
+def test_matroska_cluster_before_info(tmp_path):
+    header = ebml_element(0x1A45DFA3, ebml_element(0x4282, b"matroska"))
+    data = header + ebml_element(0x18538067, ebml_element(0x1F43B675, bytes(10)), unknown_size=True)
+    assert probe_duration(write(tmp_path, "a.mkv", data)) is None
+
+
+def test_image_duration():
+    assert video_duration("still.png") == IMAGE_DURATION
+    assert video_duration("still.jpg", "3s") == timedelta(seconds=3)
@@ -0,0 +1,54 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.config import BINARY_SCHEDULE_FILE
+from src.export import export_schedule
+from src.schedulebin import read_schedule_bin, ScheduleBinError
+from src.scheduler_types import ScheduleClip
+
+
+def clip_key(c):
+    return (c.path, c.priority, c.loop, c.start_at, c.end_at, c.duration, c.play_duration, c.cursor_start_at,
+            c.cursor_end_at)
+
+
+def make_clips() -> [ScheduleClip]:
+    t0 = datetime(2026, 3, 29, 1, 59, 59, 999999)
+    clips = []
+    for i in range(50):
+        start_at = t0 + timedelta(seconds=i * 7.25)
+        clips.append(ScheduleClip(path=f"./videos/é {i % 3}.mp4", priority=(i % 4) * 100, loop=bool(i % 2),
+                                  start_at=start_at, end_at=start_at + timedelta(seconds=7.25),
+                                  duration=timedelta(seconds=12, microseconds=345678),
+                                  play_duration=timedelta(seconds=7.25),
+                                  cursor_start_at=timedelta(microseconds=i), cursor_end_at=timedelta(seconds=7.25)))
+    return clips
+
+
+def test_round_trip(tmp_path):
+    clips = make_clips()
+    export_schedule(clips, str(tmp_path), [], 1000)
+    assert [clip_key(c) for c in read_schedule_bin(str(tmp_path / BINARY_SCHEDULE_FILE))] == \
+        [clip_key(c) for c in clips]
+
+
+def test_empty_round_trip(tmp_path):
+    export_schedule([], str(tmp_path), [], 1000)
+    assert read_schedule_bin(str(tmp_path / BINARY_SCHEDULE_FILE)) == []
+
+
+def test_truncated_file_is_rejected(tmp_path):
+    export_schedule(make_clips(), str(tmp_path), [], 1000)
+    path = str(tmp_path / BINARY_SCHEDULE_FILE)
+    os.truncate(path, os.path.getsize(path) - 1)
+    with pytest.raises(ScheduleBinError):
+        read_schedule_bin(path)
+
+
+def test_other_file_is_rejected(tmp_path):
+    path = tmp_path / BINARY_SCHEDULE_FILE
+    path.write_bytes(b"schedule: []\n" * 10)
+    with pytest.raises(ScheduleBinError):
+        read_schedule_bin(str(path))
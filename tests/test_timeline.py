@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from src.scheduler_types import ScheduleClip
+from src.timeline import resolve_timeline
+
+T0 = datetime(2026, 1, 1)
+
+
+def seconds(x: float) -> timedelta:
+    return timedelta(seconds=x)
+
+
+def make_clip(path: str, priority: int, start: float, end: float, source_id: int | None = None) -> ScheduleClip:
+    return ScheduleClip(path=path, priority=priority, start_at=T0 + seconds(start), end_at=T0 + seconds(end),
+                        duration=seconds(100), play_duration=seconds(end - start), cursor_start_at=seconds(0),
+                        cursor_end_at=seconds(end - start), source_id=source_id)
+
+
+def make_source(**policy):
+    return SimpleNamespace(**{"clip_restart_after_interruption": False, "clip_continue_after_interruption": False,
+                              "clip_skip_time_after_interruption": False, "end_at": None, **policy})
+
+
+def resolve(clips: [ScheduleClip], sources=None) -> [(str, float, float, float)]:
+    return [(c.path, (c.start_at - T0).total_seconds(), (c.end_at - T0).total_seconds(),
+             c.cursor_start_at.total_seconds()) for c in resolve_timeline(sorted(clips), sources=sources)]
+
+
+def test_priority_tie_keeps_the_clip_on_air():
+    assert resolve([make_clip("a", 10, 0, 20), make_clip("b", 10, 10, 30)]) == [
+        ("a", 0, 20, 0),
+        ("b", 20, 30, 0),
+    ]
+
+
+def test_higher_priority_interrupts():
+    # the lower the number, the higher the priority
+    assert resolve([make_clip("a", 100, 0, 20), make_clip("b", 10, 10, 30)]) == [
+        ("a", 0, 10, 0),
+        ("b", 10, 30, 0),
+    ]
+
+
+def test_nested_layers_resume_by_policy():
+    sources = {1: make_source(clip_continue_after_interruption=True),
+               2: make_source(clip_skip_time_after_interruption=True)}
+    clips = [make_clip("background", 100, 0, 60, 1), make_clip("middle", 50, 10, 40, 2),
+             make_clip("top", 10, 20, 30)]
+    assert resolve(clips, sources) == [
+        ("background", 0, 10, 0),
+        ("middle", 10, 20, 0),
+        ("top", 20, 30, 0),
+        # kept running underneath
+        ("middle", 30, 40, 20),
+        # paused, plays what remains
+        ("background", 40, 90, 10),
+    ]
+
+
+def test_stop_policy_drops_the_rest():
+    assert resolve([make_clip("a", 100, 0, 60), make_clip("b", 10, 10, 20)]) == [
+        ("a", 0, 10, 0),
+        ("b", 10, 20, 0),
+    ]
+
+
+def test_until_emits_the_clip_on_air_up_to_its_end():
+    clips = [make_clip("a", 100, 0, 60), make_clip("b", 100, 60, 120)]
+    result = list(resolve_timeline(clips, until=T0 + seconds(30)))
+    assert [(c.path, c.end_at) for c in result] == [("a", T0 + seconds(60))]